@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import threading
+import time
+
+# SQLite file holding the output of every post cycle
+ARTIFACTS_PATH = 'artifacts.db'
+
+# Cycle stages, in order. A cycle's stage is the last one it completed.
+STARTED = 'started'
+RESEARCHED = 'researched'   # research context saved
+WRITTEN = 'written'         # title and HTML saved, waiting to be published
+PUBLISHED = 'published'
+SKIPPED = 'skipped'         # stopped on purpose (duplicate, no material); never resumed
+
+UNFINISHED_STAGES = (STARTED, RESEARCHED, WRITTEN)
+
+class ArtifactStore:
+    """
+    Checkpoints of post cycles, keyed by cycle id and topic.
+
+    Each stage of a cycle saves its output as soon as it finishes, so a
+    crash or a failed publish does not throw away research or generated
+    posts: the cycle can be resumed from the last completed stage.
+
+    Args:
+        path (str): SQLite file (":memory:" for a throwaway store).
+    """
+
+    def __init__(self, path=ARTIFACTS_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cycles ('
+            ' id TEXT PRIMARY KEY,'
+            ' topic TEXT NOT NULL,'
+            ' topic_data TEXT,'
+            ' stage TEXT NOT NULL,'
+            ' is_draft INTEGER NOT NULL DEFAULT 0,'
+            ' context TEXT,'
+            ' title TEXT,'
+            ' content TEXT,'
+            ' excerpt TEXT,'
+            ' labels TEXT,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' error TEXT,'
+            ' created REAL NOT NULL,'
+            ' updated REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS cycles_topic ON cycles (topic, stage)')
+        self._conn.commit()
+
+    def start(self, cycle_id, topic_data, is_draft=False):
+        """
+        Records a new cycle for `topic_data` (a trends topic dictionary).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO cycles (id, topic, topic_data, stage, is_draft, created, updated)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (cycle_id, topic_data['title'], json.dumps(topic_data, default=dict), STARTED, int(is_draft), now, now)
+            )
+            self._conn.commit()
+
+    def save(self, cycle_id, stage, **fields):
+        """
+        Moves a cycle to `stage`, storing any of context, title, content,
+        excerpt, labels (a JSON list) and error.
+        """
+        fields['stage'] = stage
+        fields['updated'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            self._conn.execute(f'UPDATE cycles SET {columns} WHERE id = ?', (*fields.values(), cycle_id))
+            self._conn.commit()
+
+    def record_attempt(self, cycle_id, error=None):
+        """
+        Counts one publish attempt and remembers why it failed.
+        """
+        with self._lock:
+            self._conn.execute(
+                'UPDATE cycles SET attempts = attempts + 1, error = ?, updated = ? WHERE id = ?',
+                (error, time.time(), cycle_id)
+            )
+            self._conn.commit()
+
+    def get(self, cycle_id):
+        rows = self._select('WHERE id = ?', (cycle_id,))
+        return rows[0] if rows else None
+
+    def find(self, topic):
+        """
+        Returns the most recent unfinished cycle for the topic title, or None.
+        """
+        marks = ','.join('?' * len(UNFINISHED_STAGES))
+        rows = self._select(f'WHERE topic = ? AND stage IN ({marks}) ORDER BY updated DESC LIMIT 1',
+                            (topic, *UNFINISHED_STAGES))
+        return rows[0] if rows else None
+
+    def pending(self, stages=UNFINISHED_STAGES):
+        """
+        Returns cycles in the given stages, oldest first.
+        """
+        marks = ','.join('?' * len(stages))
+        return self._select(f'WHERE stage IN ({marks}) ORDER BY created', tuple(stages))
+
+    def _select(self, where, params):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, topic_data, stage, is_draft, context, title, content, excerpt, labels,'
+                ' attempts, error, created, updated'
+                f' FROM cycles {where}', params
+            ).fetchall()
+        return [{
+            'id': row[0],
+            'topic': json.loads(row[1]) if row[1] else None,
+            'stage': row[2],
+            'is_draft': bool(row[3]),
+            'context': row[4],
+            'title': row[5],
+            'content': row[6],
+            'excerpt': row[7],
+            'labels': json.loads(row[8]) if row[8] else None,
+            'attempts': row[9],
+            'error': row[10],
+            'created': row[11],
+            'updated': row[12]
+        } for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Returns the shared artifact store, opening ARTIFACTS_PATH on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore(ARTIFACTS_PATH)
+        return _store
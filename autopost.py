@@ -1,10 +1,9 @@
-import os
-import pickle
 import google.auth
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 
+import token_store
+
 # Replace this with the path to your OAuth 2.0 client secret JSON file
 CLIENT_SECRET_FILE = 'service_account_key.json'
 
@@ -18,22 +17,11 @@ POST_CONTENT = 'This is my post content.'
 SCOPES = ['https://www.googleapis.com/auth/blogger']
 
 def get_credentials():
-    creds = None
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
-
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-
-    return creds
+    def login():
+        flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
+        return flow.run_local_server(port=0)
+
+    return token_store.get_store('token.pickle').get(login)
 
 def create_post(blog_id, title, content):
     try:
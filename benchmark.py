@@ -0,0 +1,382 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import string
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+# Recorded Trends feed and news page templates served by the stand-ins
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_fixtures')
+
+# Where benchmark results are saved for comparison between runs
+RESULTS_DIR = 'bench_results'
+
+# Default simulated latencies of the stand-in servers, in seconds
+GEMINI_LATENCY = 0.5
+ARTICLE_LATENCY = 0.05
+BLOGGER_LATENCY = 0.05
+
+# Paragraphs per generated article page
+ARTICLE_PARAGRAPHS = 12
+
+def _load_fixtures():
+    with open(os.path.join(FIXTURES_DIR, 'trends_rss.xml'), 'r', encoding='utf-8') as f:
+        rss = string.Template(f.read())
+    with open(os.path.join(FIXTURES_DIR, 'article.html'), 'r', encoding='utf-8') as f:
+        article = string.Template(f.read())
+    with open(os.path.join(FIXTURES_DIR, 'paragraphs.txt'), 'r', encoding='utf-8') as f:
+        paragraphs = [line.strip() for line in f if line.strip()]
+    return rss, article, paragraphs
+
+class StandIns:
+    """
+    Local HTTP servers standing in for Google Trends, news sites, the Gemini
+    API and the Blogger v3 API, so every hot path can be measured offline.
+
+    Args:
+        gemini_latency (float): Seconds the fake Gemini endpoint takes per call.
+        article_latency (float): Seconds each news page takes to start responding.
+        blogger_latency (float): Seconds the fake Blogger API takes per insert.
+    """
+
+    def __init__(self, gemini_latency=GEMINI_LATENCY, article_latency=ARTICLE_LATENCY,
+                 blogger_latency=BLOGGER_LATENCY):
+        self.gemini_latency = gemini_latency
+        self.article_latency = article_latency
+        self.blogger_latency = blogger_latency
+        self.rss, self.article, self.paragraphs = _load_fixtures()
+        self.requests = {'trends': 0, 'search': 0, 'articles': 0, 'gemini': 0, 'blogger': 0}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.base = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.base = f'http://127.0.0.1:{self._server.server_address[1]}'
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _count(self, name):
+        with self._lock:
+            self.requests[name] += 1
+
+    def article_page(self, number):
+        title_match = re.findall(r'<ht:news_item_title>(.*?)</ht:news_item_title>', self.rss.template)
+        title = title_match[number % len(title_match)] if title_match else f"Story {number}"
+        count = len(self.paragraphs)
+        chosen = [self.paragraphs[(number * 7 + i) % count] for i in range(ARTICLE_PARAGRAPHS)]
+        body = '\n'.join(f'        <p>{p}</p>' for p in chosen)
+        return self.article.substitute(title=title, source="Example News", paragraphs=body)
+
+    def _handler(self):
+        standins = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/trending/rss':
+                    standins._count('trends')
+                    geo = parse_qs(url.query).get('geo', ['US'])[0]
+                    self._send(200, standins.rss.substitute(base=standins.base, geo=geo),
+                               'application/rss+xml; charset=utf-8')
+                elif url.path == '/search':
+                    standins._count('search')
+                    query = parse_qs(url.query).get('q', [''])[0]
+                    start = sum(map(ord, query)) % 30
+                    results = [{'url': f'{standins.base}/articles/{(start + i) % 30}'} for i in range(5)]
+                    self._send(200, json.dumps({'query': query, 'results': results}), 'application/json')
+                elif url.path.startswith('/articles/'):
+                    standins._count('articles')
+                    time.sleep(standins.article_latency)
+                    number = int(url.path.rsplit('/', 1)[1])
+                    self._send(200, standins.article_page(number), 'text/html; charset=utf-8')
+                else:
+                    self._send(404, 'Not found', 'text/plain')
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self._read_body()
+                if url.path.endswith(':generateContent'):
+                    standins._count('gemini')
+                    time.sleep(standins.gemini_latency)
+                    prompt = json.loads(body or b'{}').get('prompt', '')
+                    topic = re.search(r'TOPIC: (.*)', prompt)
+                    title = f"What to know about {topic.group(1).strip() if topic else 'this story'}"
+                    paragraphs = ''.join(f'<p>{p}</p>' for p in standins.paragraphs[:6])
+                    reply = f"TITLE: {title}\nCONTENT:\n```html\n<h2>Overview</h2>{paragraphs}<h2>Conclusion</h2><p>More soon.</p>\n```"
+                    self._send(200, json.dumps({
+                        'candidates': [{'content': {'parts': [{'text': reply}]}}],
+                        'usageMetadata': {'promptTokenCount': len(prompt) // 4,
+                                          'candidatesTokenCount': len(reply) // 4}
+                    }), 'application/json')
+                elif re.match(r'^/v3/blogs/[^/]+/posts/?$', url.path):
+                    standins._count('blogger')
+                    time.sleep(standins.blogger_latency)
+                    post = json.loads(body or b'{}')
+                    post_id = str(standins.requests['blogger'])
+                    self._send(200, json.dumps({
+                        'kind': 'blogger#post',
+                        'id': post_id,
+                        'title': post.get('title'),
+                        'url': f'{standins.base}/posts/{post_id}.html'
+                    }), 'application/json')
+                else:
+                    self._send(404, 'Not found', 'text/plain')
+
+        return Handler
+
+class FakeModel:
+    """
+    Drop-in for genai.GenerativeModel that calls the Gemini stand-in over HTTP.
+    """
+
+    def __init__(self, base, model_name):
+        self.url = f'{base}/v1beta/models/{model_name}:generateContent'
+        self.session = requests.Session()
+
+    def generate_content(self, prompt):
+        data = self.session.post(self.url, json={'prompt': prompt}, timeout=30).json()
+        usage = data.get('usageMetadata', {})
+        return SimpleNamespace(
+            text=data['candidates'][0]['content']['parts'][0]['text'],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=usage.get('promptTokenCount'),
+                candidates_token_count=usage.get('candidatesTokenCount')
+            )
+        )
+
+@contextlib.contextmanager
+def offline(standins):
+    """
+    Points trends, research, writer and publisher at the stand-ins, with
+    on-disk caches and politeness delays turned off, for the duration of the block.
+    """
+    import httplib2
+    from googleapiclient.discovery import build
+
+    import artifacts
+    import publisher
+    import research
+    import search
+    import topic_index
+    import trend_history
+    import trends
+    import writer
+
+    service = build('blogger', 'v3', http=httplib2.Http(), static_discovery=True,
+                    client_options={'api_endpoint': standins.base + '/'})
+    client = publisher.BloggerClient(blog_id='bench')
+    client._creds = SimpleNamespace(expiry=None, refresh_token=None, valid=True)
+    client._service = service
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(patch.object(trends, 'RSS_URL', standins.base + '/trending/rss?geo={geo}'))
+        stack.enter_context(patch.object(research, 'HOST_DELAY', (0, 0)))
+        stack.enter_context(patch.object(research, 'ARTICLE_CACHE_PATH', None))
+        stack.enter_context(patch.object(research, '_article_cache', None))
+        stack.enter_context(patch.object(search, '_client',
+                                         search.SearchClient(search.JsonApiProvider(standins.base + '/search'),
+                                                             use_cache=False)))
+        stack.enter_context(patch.object(writer, 'GENERATION_CACHE_PATH', None))
+        stack.enter_context(patch.object(writer, '_generation_cache', None))
+        stack.enter_context(patch.dict(writer._models, {writer.MODEL_NAME: FakeModel(standins.base, writer.MODEL_NAME)}))
+        stack.enter_context(patch.dict(writer._clients, {writer.MODEL_NAME: writer.GeminiClient(rpm=10 ** 6, tpm=10 ** 9)}))
+        stack.enter_context(patch.object(publisher, '_default_client', client))
+        stack.enter_context(patch.object(artifacts, '_store', artifacts.ArtifactStore(':memory:')))
+        stack.enter_context(patch.object(trend_history, '_history', trend_history.TrendHistory(':memory:')))
+        # A fresh index on every lookup, so no topic is ever skipped as already posted
+        stack.enter_context(patch.object(topic_index, 'get_index', lambda: topic_index.PublishedIndex(':memory:')))
+        trends.clear_cache()
+        yield
+
+def measure(name, func, iterations):
+    """
+    Calls `func(i)` `iterations` times and summarises the latencies.
+    """
+    latencies = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            func(i)
+            latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'name': name,
+        'iterations': iterations,
+        'total_s': round(total, 6),
+        'throughput_per_s': round(iterations / total, 3) if total else None,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3)
+    }
+
+def run(iterations=5, gemini_latency=GEMINI_LATENCY, article_latency=ARTICLE_LATENCY,
+        blogger_latency=BLOGGER_LATENCY, batch_size=5):
+    """
+    Runs every benchmark against fresh stand-ins.
+
+    Returns:
+        dict: Settings, per-benchmark results and stand-in request counts.
+    """
+    import main
+    import publisher
+    import research
+    import trends
+    import writer
+
+    results = []
+    with StandIns(gemini_latency, article_latency, blogger_latency) as standins, offline(standins):
+        topics = trends.get_trending_topics()
+
+        def uncached_trends(i):
+            trends.clear_cache()
+            trends.get_trending_topics()
+
+        def topic(i):
+            return topics[i % len(topics)]
+
+        results.append(measure('get_trending_topics', uncached_trends, iterations))
+        results.append(measure('get_trending_topics (cached)', lambda i: trends.get_trending_topics(), iterations))
+        results.append(measure('extract_text_from_url',
+                               lambda i: research.extract_text_from_url(f'{standins.base}/articles/{i}'), iterations))
+        results.append(measure('research_topic',
+                               lambda i: research.research_topic(topic(i)['title'],
+                                                                 topic(i)['news_items']),
+                               iterations))
+        results.append(measure('research_topic (search fallback)',
+                               lambda i: research.research_topic(topic(i)['title']), iterations))
+        with contextlib.redirect_stdout(io.StringIO()):
+            context = research.research_topic(topics[0]['title'], topics[0]['news_items'])
+        results.append(measure('write_blog_post',
+                               lambda i: writer.write_blog_post(topic(i)['title'], context, use_cache=False),
+                               iterations))
+        results.append(measure('publish_post',
+                               lambda i: publisher.publish_post(f"Benchmark post {i}", "<p>Body</p>"), iterations))
+        results.append(measure('run_post_cycle', lambda i: main.run_post_cycle(topic(i)), iterations))
+        batch = measure('run_batch', lambda i: main.run_batch(batch_size, publish_interval=0), 1)
+        batch['posts'] = batch_size
+        batch['posts_per_s'] = round(batch_size / batch['total_s'], 3)
+        results.append(batch)
+
+        requests_made = dict(standins.requests)
+
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'settings': {
+            'iterations': iterations,
+            'gemini_latency': gemini_latency,
+            'article_latency': article_latency,
+            'blogger_latency': blogger_latency,
+            'batch_size': batch_size
+        },
+        'results': results,
+        'requests': requests_made
+    }
+
+def save(report, directory=RESULTS_DIR):
+    """
+    Writes `report` to a timestamped JSON file in `directory` and returns its path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def latest(directory=RESULTS_DIR, exclude=None):
+    """
+    Returns the path of the most recent saved report (other than `exclude`), or None.
+    """
+    if not os.path.isdir(directory):
+        return None
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.startswith('bench-') and name.endswith('.json'))
+    paths = [p for p in paths if p != exclude]
+    return paths[-1] if paths else None
+
+def print_report(report, baseline=None):
+    previous = {}
+    if baseline:
+        previous = {r['name']: r for r in baseline['results']}
+
+    print(f"{'benchmark':32} {'iters':>5} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>9} {'vs base':>9}")
+    for r in report['results']:
+        change = ''
+        old = previous.get(r['name'])
+        if old and old['p50_ms']:
+            change = f"{(r['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100:+.1f}%"
+        print(f"{r['name']:32} {r['iterations']:>5} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} "
+              f"{r['throughput_per_s'] or 0:>9.2f} {change:>9}")
+    print(f"Stand-in requests: {report['requests']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the auto-poster hot paths.")
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--gemini-latency', type=float, default=GEMINI_LATENCY)
+    parser.add_argument('--article-latency', type=float, default=ARTICLE_LATENCY)
+    parser.add_argument('--blogger-latency', type=float, default=BLOGGER_LATENCY)
+    parser.add_argument('--batch-size', type=int, default=5)
+    parser.add_argument('--out', default=RESULTS_DIR, help="Directory for saved results")
+    parser.add_argument('--baseline', help="Saved result to compare against (default: latest in --out)")
+    args = parser.parse_args()
+
+    report = run(args.iterations, args.gemini_latency, args.article_latency, args.blogger_latency, args.batch_size)
+    path = save(report, args.out)
+
+    baseline_path = args.baseline or latest(args.out, exclude=path)
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        print(f"Comparing with {baseline_path}")
+    print_report(report, baseline)
+    print(f"Saved results to {path}")
+
+if __name__ == "__main__":
+    main()
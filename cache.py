@@ -0,0 +1,137 @@
+import json
+import sqlite3
+import threading
+import time
+
+# Default size limit of a cache file's stored values, in bytes
+MAX_BYTES = 50 * 1024 * 1024
+
+class DiskCache:
+    """
+    Small persistent key/value cache backed by SQLite.
+
+    Values are stored as JSON together with the time they were stored and
+    optional HTTP validators (ETag / Last-Modified) so callers can
+    revalidate stale entries. When the stored values grow past `max_bytes`
+    the least recently used entries are evicted.
+
+    Args:
+        path (str): SQLite file (":memory:" for a throwaway cache).
+        max_bytes (int): Size limit for stored values.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' accessed_at REAL NOT NULL,'
+            ' etag TEXT,'
+            ' last_modified TEXT)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at)')
+        self._conn.commit()
+        self._stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'evictions': 0}
+
+    def get(self, key, max_age=None):
+        """
+        Looks up `key`.
+
+        Returns:
+            dict: {'value', 'stored_at', 'etag', 'last_modified', 'fresh'} or None.
+                  'fresh' is False when the entry is older than `max_age` seconds.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, stored_at, etag, last_modified FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+
+            fresh = max_age is None or now - row[1] < max_age
+            self._stats['hits' if fresh else 'misses'] += 1
+
+        return {
+            'value': json.loads(row[0]),
+            'stored_at': row[1],
+            'etag': row[2],
+            'last_modified': row[3],
+            'fresh': fresh
+        }
+
+    def set(self, key, value, etag=None, last_modified=None):
+        """
+        Stores `value` (anything JSON-serialisable) under `key`.
+        """
+        data = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, stored_at, accessed_at, etag, last_modified)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, data, len(data), now, now, etag, last_modified)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, key):
+        """
+        Marks an entry as just revalidated (e.g. after an HTTP 304).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            self._conn.commit()
+            self._stats['revalidated'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Drops least recently used entries until the cache is back under 90% of its limit.
+        """
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM entries WHERE key = ?', doomed)
+        self._stats['evictions'] += len(doomed)
+
+    def stats(self):
+        """
+        Returns hit/miss counters for this process plus the cache's current size.
+        """
+        with self._lock:
+            count, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = count
+        stats['bytes'] = size
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,144 @@
+import math
+import re
+from collections import Counter
+
+# Default prompt budget for research context, in (estimated) tokens
+TOKEN_BUDGET = 3000
+
+# Rough characters-per-token ratio used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+# Passages are built from consecutive lines until they reach this many words
+PASSAGE_WORDS = 80
+
+# Lines shorter than this (in words) and not ending a sentence are treated as boilerplate
+MIN_LINE_WORDS = 6
+
+# A passage is dropped if this share of its word shingles already appeared elsewhere
+DUPLICATE_OVERLAP = 0.6
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+a about an and are as at be been but by can for from had has have he her his how i if in into
+is it its more not of on or our said she so than that the their them there they this to was we
+were what when which who will with would you your
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _terms(text):
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+def split_passages(text, passage_words=PASSAGE_WORDS):
+    """
+    Groups the lines of an extracted article into passages of roughly
+    `passage_words` words, dropping short menu-like fragments.
+    """
+    passages = []
+    current = []
+    words = 0
+    for line in text.splitlines():
+        line = line.strip()
+        count = len(line.split())
+        if not line or (count < MIN_LINE_WORDS and not line.endswith(('.', '!', '?'))):
+            continue
+        current.append(line)
+        words += count
+        if words >= passage_words:
+            passages.append(' '.join(current))
+            current, words = [], 0
+    if current:
+        passages.append(' '.join(current))
+    return passages
+
+def _shingles(terms, size=4):
+    if len(terms) < size:
+        return {' '.join(terms)} if terms else set()
+    return {' '.join(terms[i:i + size]) for i in range(len(terms) - size + 1)}
+
+def assemble_context(topic, sources, token_budget=TOKEN_BUDGET):
+    """
+    Builds a compact research context for the writer.
+
+    Each source is split into passages, passages repeated across sources
+    are dropped, and the rest are ranked against the topic with BM25. The
+    best passages are packed into `token_budget` and written out grouped by
+    source, in their original order.
+
+    Args:
+        topic (str): The trend title.
+        sources (list): (url, text) pairs.
+        token_budget (int): Maximum estimated tokens of the returned context.
+
+    Returns:
+        str: The context, or "" if no source had usable text.
+    """
+    header = f"Research for Topic: {topic}\n\n"
+
+    # 1. Passages, minus the ones another source already said
+    passages = []  # (source index, position, text, terms)
+    seen = set()
+    for s_index, (url, text) in enumerate(sources):
+        for position, passage in enumerate(split_passages(text)):
+            terms = _terms(passage)
+            shingles = _shingles(terms)
+            if not shingles:
+                continue
+            overlap = len(shingles & seen) / len(shingles)
+            seen |= shingles
+            if overlap >= DUPLICATE_OVERLAP:
+                continue
+            passages.append((s_index, position, passage, terms))
+
+    if not passages:
+        return ""
+
+    # 2. BM25 score of every passage against the topic
+    query = set(_terms(topic))
+    doc_freq = Counter()
+    for _, _, _, terms in passages:
+        doc_freq.update(query.intersection(terms))
+    n = len(passages)
+    avg_len = sum(len(p[3]) for p in passages) / n
+    idf = {term: math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5)) for term in query}
+
+    scored = []
+    for s_index, position, passage, terms in passages:
+        tf = Counter(t for t in terms if t in query)
+        norm = K1 * (1 - B + B * len(terms) / avg_len)
+        score = sum(idf[t] * f * (K1 + 1) / (f + norm) for t, f in tf.items())
+        # Ties go to passages near the top of an article (ledes carry the facts)
+        score += 0.1 / (1 + position)
+        scored.append((score, s_index, position, passage))
+
+    # 3. Greedy packing into the budget
+    budget = token_budget - estimate_tokens(header)
+    chosen = []
+    used_sources = set()
+    for score, s_index, position, passage in sorted(scored, key=lambda p: -p[0]):
+        cost = estimate_tokens(passage)
+        if s_index not in used_sources:
+            cost += estimate_tokens(f"--- Source: {sources[s_index][0]} ---\n")
+        if cost > budget:
+            continue
+        chosen.append((s_index, position, passage))
+        used_sources.add(s_index)
+        budget -= cost
+
+    # 4. Re-group by source, in reading order
+    parts = [header]
+    current = None
+    for s_index, position, passage in sorted(chosen):
+        if s_index != current:
+            if current is not None:
+                parts.append('\n')
+            parts.append(f"--- Source: {sources[s_index][0]} ---\n")
+            current = s_index
+        parts.append(passage + '\n')
+    return ''.join(parts)
@@ -0,0 +1,172 @@
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+from lxml import html as lxml_html
+
+# Maximum characters of article text kept per page
+MAX_CHARS = 10000
+
+# Elements that never contain article text
+DROP_TAGS = ('script', 'style', 'nav', 'footer', 'header', 'aside', 'noscript',
+             'form', 'iframe', 'svg', 'button', 'select')
+
+# Elements whose text makes up the readable body of an article
+BLOCK_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li', 'pre', 'blockquote')
+
+# Paragraphs shorter than this are not counted when scoring containers
+MIN_PARAGRAPH = 25
+
+# If the best container has less text than this, use the whole page instead
+MIN_ARTICLE = 200
+
+_WHITESPACE = re.compile(r'\s+')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def extract_main_text(page, max_chars=MAX_CHARS):
+    """
+    Extracts the main article text from an HTML page.
+
+    The container holding the most paragraph text (discounted by how much of
+    it is link text) is taken as the article. Its headings, paragraphs and
+    list items are collected in order until `max_chars` is reached.
+
+    Args:
+        page (str or bytes): Raw HTML.
+        max_chars (int): Character budget for the returned text.
+
+    Returns:
+        str: Article text, one block per line ("" if nothing was found).
+    """
+    if not page or not page.strip():
+        return ""
+
+    try:
+        doc = lxml_html.document_fromstring(page)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        if not isinstance(page, str):
+            return ""
+        try:
+            doc = lxml_html.document_fromstring(page.encode('utf-8'))
+        except (etree.ParserError, ValueError):
+            return ""
+    except etree.ParserError:
+        return ""
+
+    etree.strip_elements(doc, *DROP_TAGS, with_tail=False)
+    etree.strip_elements(doc, etree.Comment, with_tail=False)
+
+    best = _best_container(doc)
+    if best is not None:
+        text = _collect_blocks(best, max_chars)
+        if len(text) >= MIN_ARTICLE or len(text) >= max_chars:
+            return text[:max_chars]
+
+    body = doc.find('body')
+    return _collect_all(body if body is not None else doc, max_chars)
+
+def _clean(text):
+    return _WHITESPACE.sub(' ', text).strip()
+
+def _best_container(doc):
+    """
+    Scores the parents of every paragraph by the text they contain and
+    returns the highest-scoring one.
+    """
+    scores = {}
+    for p in doc.iter('p', 'pre', 'blockquote'):
+        length = len(_clean(p.text_content()))
+        if length < MIN_PARAGRAPH:
+            continue
+        score = 1 + length / 100.0
+        parent = p.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0) + score
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+
+    best, best_score = None, 0
+    for element, score in scores.items():
+        score *= 1 - _link_density(element)
+        if score > best_score:
+            best, best_score = element, score
+    return best
+
+def _link_density(element):
+    total = len(element.text_content())
+    if not total:
+        return 0
+    links = sum(len(a.text_content()) for a in element.iter('a'))
+    return min(1.0, links / total)
+
+def _collect_blocks(container, max_chars):
+    """
+    Joins the text of the block elements in `container`, stopping at the budget.
+    """
+    parts = []
+    size = 0
+    for element in container.iter(*BLOCK_TAGS):
+        if _inside_block(element, container):
+            continue
+        text = _clean(element.text_content())
+        if not text:
+            continue
+        parts.append(text)
+        size += len(text) + 1
+        if size >= max_chars:
+            break
+    return '\n'.join(parts)
+
+def _inside_block(element, container):
+    parent = element.getparent()
+    while parent is not None and parent is not container:
+        if parent.tag in BLOCK_TAGS:
+            return True
+        parent = parent.getparent()
+    return False
+
+def _collect_all(root, max_chars):
+    """
+    Fallback: every text node of the page, stopping at the budget.
+    """
+    parts = []
+    size = 0
+    for chunk in root.itertext():
+        text = _clean(chunk)
+        if not text:
+            continue
+        parts.append(text)
+        size += len(text) + 1
+        if size >= max_chars:
+            break
+    return '\n'.join(parts)[:max_chars]
+
+def get_process_pool(workers=None):
+    """
+    Returns the shared process pool used to parse pages off the main process.
+
+    `workers` only sizes the pool when it is first started; later calls get
+    the running pool whatever they ask for. Call shutdown_pool() to start
+    over with a different size.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+def shutdown_pool():
+    """
+    Stops the shared process pool, if it was started.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
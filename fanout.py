@@ -0,0 +1,180 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import publisher
+import ratelimit
+import research
+import topic_index
+import trend_history
+import trends
+import writer
+
+# Default file listing the blogs to feed
+BLOGS_FILE = 'blogs.json'
+
+# Threads shared by all blogs for writing and publishing
+WORKERS = 4
+
+# Per-blog defaults, used when a blog's config leaves them out
+REQUESTS_PER_MINUTE = 5
+POSTS_PER_HOUR = 6
+
+class Blog:
+    """
+    One target blog with its own account, duplicate index and rate limits.
+
+    Args:
+        name (str): Short label, also used to name the blog's local files.
+        blog_id (str): Blogger blog id (looked up on first publish if omitted).
+        token_file (str): OAuth token of the account that owns the blog.
+        client_secret_file (str): OAuth client secret used to sign in that account.
+        geo (str): Country whose trends the blog covers.
+        posts (int): Posts to publish per run.
+        style (str): Extra writing instructions for this blog's audience.
+        requests_per_minute (float): Gemini requests this blog may use.
+        posts_per_hour (float): Publishing rate for this blog.
+        is_draft (bool): Save posts as drafts.
+    """
+
+    def __init__(self, name, blog_id=None, token_file=None, client_secret_file='client_secret.json',
+                 geo='US', posts=1, style=None, requests_per_minute=REQUESTS_PER_MINUTE,
+                 posts_per_hour=POSTS_PER_HOUR, is_draft=False, index_file=None):
+        self.name = name
+        self.geo = geo
+        self.posts = posts
+        self.style = style
+        self.is_draft = is_draft
+        self.client = publisher.BloggerClient(
+            client_secret_file=client_secret_file,
+            token_file=token_file or f'token_{name}.pickle',
+            config_file=f'blog_config_{name}.json',
+            blog_id=blog_id
+        )
+        self.index = topic_index.PublishedIndex(index_file or f'published_index_{name}.db')
+        self.generate_limit = ratelimit.TokenBucket(requests_per_minute)
+        self.publish_limit = ratelimit.TokenBucket(posts_per_hour, per=3600.0)
+        # The Blogger service and its HTTP connection are not thread-safe
+        self.publish_lock = threading.Lock()
+
+def load_blogs(path=BLOGS_FILE):
+    """
+    Reads blog definitions from a JSON file:
+
+        {"blogs": [{"name": "tech", "blog_id": "123", "geo": "US", "posts": 2}, ...]}
+
+    Returns:
+        list: Blog objects.
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return [Blog(**entry) for entry in data.get('blogs', [])]
+
+class FanOut:
+    """
+    Feeds several blogs from one shared trends/research layer.
+
+    Trends are fetched once per geo and each topic is researched once, no
+    matter how many blogs pick it. Writing and publishing for every blog is
+    spread over one worker pool, with each blog held to its own limits.
+    """
+
+    def __init__(self, blogs, workers=WORKERS):
+        self.blogs = blogs
+        self.workers = workers
+        self._research = {}
+        self._research_lock = threading.Lock()
+
+    def research(self, topic):
+        """
+        Returns the research context for `topic`, computing it once per run
+        even when several blogs ask at the same time.
+        """
+        with self._research_lock:
+            entry = self._research.get(topic['title'])
+            if entry is None:
+                entry = {'done': threading.Event(), 'context': None}
+                self._research[topic['title']] = entry
+                owner = True
+            else:
+                owner = False
+
+        if owner:
+            try:
+                context = research.research_topic(topic['title'], topic.get('news_items', []))
+                if context and "No information found" not in context:
+                    entry['context'] = context
+            finally:
+                entry['done'].set()
+        else:
+            entry['done'].wait()
+        return entry['context']
+
+    def plan(self):
+        """
+        Picks each blog's rising topics from its geo's trends, skipping what that blog already posted.
+
+        Returns:
+            list: (blog, topic) pairs.
+        """
+        geos = sorted({blog.geo for blog in self.blogs})
+        by_geo = dict(zip(geos, (trends.get_trending_topics(geo) for geo in geos)))
+
+        jobs = []
+        for blog in self.blogs:
+            for topic in trend_history.rank_topics(by_geo[blog.geo], blog.geo, index=blog.index)[:blog.posts]:
+                jobs.append((blog, topic))
+        return jobs
+
+    def run(self):
+        """
+        Researches, writes and publishes every planned post.
+
+        Each blog's id is looked up (signing in or asking which blog, if
+        needed) before the worker pool starts, so no prompt runs inside a
+        worker. Posts to the same blog are published one at a time.
+
+        Returns:
+            list: One dictionary per job with 'blog', 'topic', 'title' and 'published'.
+        """
+        jobs = self.plan()
+        ready = set()
+        for blog in dict.fromkeys(blog for blog, _ in jobs):
+            if blog.client.blog_id():
+                ready.add(blog)
+            else:
+                print(f"[{blog.name}] ❌ Could not find the blog; skipping its posts.")
+        jobs = [(blog, topic) for blog, topic in jobs if blog in ready]
+        if not jobs:
+            print("No new topics for any blog.")
+            return []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(lambda job: self._post(*job), jobs))
+
+    def _post(self, blog, topic):
+        result = {'blog': blog.name, 'topic': topic['title'], 'title': None, 'published': False}
+        try:
+            context = self.research(topic)
+            if not context:
+                print(f"[{blog.name}] ⚠️ Not enough info found for '{topic['title']}'. Skipping.")
+                return result
+
+            blog.generate_limit.acquire()
+            post = writer.generate_post(topic['title'], context, style=blog.style, variant=blog.name)
+            if not post or not post['title'] or not post['content']:
+                print(f"[{blog.name}] ❌ AI failed to generate content.")
+                return result
+            title, content = post['title'], post['content']
+            result['title'] = title
+
+            blog.publish_limit.acquire()
+            with blog.publish_lock:
+                result['published'] = blog.client.publish(title, content, is_draft=blog.is_draft,
+                                                          labels=post.get('labels'))
+            if result['published']:
+                blog.index.add(topic['title'], title, content)
+                print(f"[{blog.name}] 🎉 Published: {title}")
+        except Exception as e:
+            print(f"[{blog.name}] Error posting '{topic['title']}': {e}")
+        return result
@@ -1,18 +1,60 @@
+import argparse
+import importlib
+import json
 import os
+import subprocess
 import time
 import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from getpass import getpass
 
-# Import our modules
-import trends
-import research
-import writer
-import publisher
+# Only light modules are imported here. trends, research, writer and publisher
+# pull in requests, lxml, google.generativeai and googleapiclient, so each
+# function imports what it needs to keep short CLI commands fast.
+import artifacts
+import metrics
+import pipeline
+import ratelimit
+import topic_index
+import trend_history
+import scheduler
+
+# Worker threads per pipeline stage in batch mode
+RESEARCH_WORKERS = 2
+WRITE_WORKERS = 3
+
+# Worker processes parsing fetched pages in batch and backfill runs (0 parses in the fetching thread)
+BATCH_PARSE_PROCESSES = 2
+
+# Minimum seconds between two published posts in batch mode
+PUBLISH_INTERVAL = 600
+
+# Concurrent post cycles in backfill mode: starting point and ceiling of the adaptive limit
+BACKFILL_CONCURRENCY = 2
+BACKFILL_MAX_CONCURRENCY = 8
+
+# Written backfill posts sent to Blogger per batch request
+BACKFILL_PUBLISH_BATCH = 10
+
+# Default JSON file with CLI settings (keys match the command-line flags)
+CONFIG_FILE = 'autopost.json'
+
+# Target wall time for `python main.py --help`, checked by the doctor command
+STARTUP_BUDGET = 0.5
+
+# Third-party libraries that are only imported by the commands that need them
+HEAVY_MODULES = ('lxml.html', 'requests', 'googleapiclient.discovery', 'google.generativeai')
 
 def setup_environment():
     """
     Checks for necessary keys and files.
     """
+    import publisher
+    import writer
+
     print("=== Auto Blogspot Poster Setup ===")
 
     # 1. Google Gemini API Key
@@ -44,7 +86,7 @@ def setup_environment():
 
     # 3. Authenticate Blogger
     print("\n[Blogger Setup] Authenticating...")
-    creds = publisher.get_credentials()
+    creds = publisher.get_client().credentials()
     if not creds:
         print("❌ Blogger Authentication Failed.")
         return False
@@ -52,57 +94,462 @@ def setup_environment():
 
     return True
 
-def run_post_cycle(topic_data=None):
+def checkpoint(job, stage, **fields):
+    """
+    Saves a completed stage of a checkpointed job (one with a 'cycle' id).
+    """
+    if job.get('cycle'):
+        artifacts.get_store().save(job['cycle'], stage, **fields)
+
+def new_job(topic, is_draft=False, trace=None, resume=True):
+    """
+    Creates a checkpointed job for `topic`. If `resume` is set and an earlier
+    cycle for the same topic never finished, that cycle is picked up instead,
+    with whatever research and content it had already saved.
+    """
+    store = artifacts.get_store()
+    previous = store.find(topic['title']) if resume else None
+    if previous:
+        print(f"♻️ Resuming '{topic['title']}' after the '{previous['stage']}' stage.")
+        return job_from_cycle(previous, trace)
+
+    cycle_id = trace.id if trace else uuid.uuid4().hex[:12]
+    store.start(cycle_id, topic, is_draft)
+    return {'topic': topic, 'is_draft': is_draft, 'trace': trace, 'cycle': cycle_id}
+
+def job_from_cycle(cycle, trace=None):
+    """
+    Rebuilds a pipeline job from a saved cycle.
+    """
+    job = {'topic': cycle['topic'], 'is_draft': cycle['is_draft'], 'trace': trace, 'cycle': cycle['id']}
+    for name in ('context', 'title', 'content', 'excerpt', 'labels'):
+        if cycle[name]:
+            job[name] = cycle[name]
+    return job
+
+def research_stage(job):
+    """
+    Pipeline stage: gathers research context for job['topic'].
+    Returns the job, or None if there is not enough material.
+    """
+    import research
+
+    topic_title = job['topic']['title']
+    duplicate = topic_index.get_index().find_duplicate(topic_title)
+    if duplicate:
+        print(f"⚠️ '{topic_title}' was already covered by '{duplicate['title'] or duplicate['topic']}'. Skipping.")
+        checkpoint(job, artifacts.SKIPPED, error='duplicate')
+        return None
+
+    if job.get('context'):
+        return job
+
+    print(f"🔍 Researching: {topic_title}")
+    # The feed's news items are ranked by relevance before fetching
+    with metrics.timed('research', job.get('trace')):
+        context = research.research_topic(topic_title, job['topic'].get('news_items', []))
+
+    if not context or "No information found" in context:
+        print(f"⚠️ Not enough info found for '{topic_title}'. Skipping.")
+        checkpoint(job, artifacts.SKIPPED, error='no information found')
+        return None
+
+    job['context'] = context
+    checkpoint(job, artifacts.RESEARCHED, context=context)
+    return job
+
+def write_stage(job):
+    """
+    Pipeline stage: generates the post title and HTML from the research context.
+    """
+    import writer
+
+    if job.get('title') and job.get('content'):
+        return job
+
+    print(f"✍️ Writing content: {job['topic']['title']}")
+    with metrics.timed('write', job.get('trace')):
+        post = writer.generate_post(job['topic']['title'], job['context'])
+
+    if not post or not post['title'] or not post['content']:
+        print("❌ AI failed to generate content.")
+        return None
+    title, content = post['title'], post['content']
+
+    duplicate = topic_index.get_index().find_duplicate(job['topic']['title'], content)
+    if duplicate:
+        print(f"⚠️ '{title}' repeats the earlier post '{duplicate['title'] or duplicate['topic']}'. Skipping.")
+        checkpoint(job, artifacts.SKIPPED, error='duplicate content')
+        return None
+
+    print(f"✅ Content generated: {title}")
+    job['title'] = title
+    job['content'] = content
+    job['excerpt'] = post.get('excerpt')
+    job['labels'] = post.get('labels')
+    checkpoint(job, artifacts.WRITTEN, title=title, content=content,
+               excerpt=job['excerpt'], labels=json.dumps(job['labels'] or []))
+    return job
+
+def publish_stage(job):
+    """
+    Pipeline stage: publishes the generated post to Blogger.
+    """
+    import publisher
+
+    print(f"Cc Publishing to Blogger: {job['title']}")
+    with metrics.timed('publish_cycle', job.get('trace')):
+        published = publisher.publish_post(job['title'], job['content'], is_draft=job.get('is_draft', False),
+                                           labels=job.get('labels'))
+    return record_publish(job, published)
+
+def publish_jobs(jobs):
+    """
+    Publishes several written jobs through one PublishQueue, so Blogger
+    gets a few batch requests instead of one request per post.
+
+    Returns:
+        list: The jobs, each with 'published' set.
+    """
+    import publisher
+
+    if not jobs:
+        return []
+    print(f"Cc Publishing {len(jobs)} posts to Blogger in batches...")
+    with metrics.timed('publish_batch_cycle'):
+        results = publisher.publish_posts(jobs)
+    for job, result in zip(jobs, results):
+        record_publish(job, result['success'])
+    return jobs
+
+def record_publish(job, published):
+    """
+    Stores the outcome of a publish attempt: the checkpoint, the duplicate
+    index and job['published'].
+    """
+    job['published'] = published
+    if job.get('cycle'):
+        artifacts.get_store().record_attempt(job['cycle'], None if published else 'publish failed')
+
+    if published:
+        topic_index.get_index().add(job['topic']['title'], job['title'], job['content'])
+        checkpoint(job, artifacts.PUBLISHED)
+        print("🎉 Post published successfully!")
+    else:
+        print("❌ Publishing failed. The post is saved; run `python main.py publish-pending` to retry.")
+    return job
+
+def run_post_cycle(topic_data=None, geo='US', is_draft=False, resume=True, publish=True):
     """
     Runs a single cycle of Research -> Write -> Post.
-    If topic_data is None, it picks a fresh trending topic.
+    If topic_data is None, it picks a fresh trending topic. Each stage is
+    checkpointed; with `resume`, an unfinished earlier cycle for the same
+    topic continues from its last completed stage.
+
+    Returns:
+        dict: The finished job, or None if the cycle stopped early.
     """
+    import trends
+
+    trace = metrics.start_trace(topic_data['title'] if topic_data else 'top trend')
     try:
         if not topic_data:
             # Fetch fresh trends
             print("\nFetching fresh trends...")
-            current_trends = trends.get_trending_topics()
+            current_trends = trends.get_trending_topics(geo)
             if not current_trends:
                 print("No trends found.")
-                return
-            topic_data = current_trends[0] # Pick the top one
+                return None
+            rising = trend_history.rank_topics(current_trends, geo)
+            if not rising:
+                print("No new trending topics.")
+                return None
+            topic_data = rising[0] # Pick the fastest riser
+
+        print(f"\n🚀 Starting cycle for topic: {topic_data['title']}")
+
+        trace.name = topic_data['title']
+        job = new_job(topic_data, is_draft, trace, resume)
+        stages = (research_stage, write_stage, publish_stage) if publish else (research_stage, write_stage)
+        for stage in stages:
+            job = stage(job)
+            if job is None:
+                return None
+        return job
 
-        topic_title = topic_data['title']
-        print(f"\n🚀 Starting cycle for topic: {topic_title}")
+    except Exception as e:
+        print(f"Error in post cycle: {e}")
+        return None
+    finally:
+        metrics.finish_trace(trace)
 
-        # Research
-        print("🔍 Researching...")
-        # Collect URLs if available
-        urls = [item['url'] for item in topic_data.get('news_items', [])]
-        context = research.research_topic(topic_title, urls)
+@contextmanager
+def parse_processes(workers=BATCH_PARSE_PROCESSES):
+    """
+    Has research parse pages in `workers` processes until the block ends,
+    then stops the process pool.
+    """
+    import extractor
+    import research
 
-        if not context or "No information found" in context:
-            print("⚠️ Not enough info found. Skipping.")
-            return
+    previous = research.PARSE_PROCESSES
+    research.PARSE_PROCESSES = workers
+    try:
+        yield
+    finally:
+        research.PARSE_PROCESSES = previous
+        extractor.shutdown_pool()
 
-        # Write
-        print("✍️ Writing content...")
-        title, content = writer.write_blog_post(topic_title, context)
+def run_batch(count, publish_interval=PUBLISH_INTERVAL, geo='US'):
+    """
+    Publishes up to `count` trending topics through a staged pipeline.
 
-        if not title or not content:
-            print("❌ AI failed to generate content.")
-            return
+    Research and writing for the next posts run while earlier posts wait
+    for their publish slot, so the slowest stage sets the pace.
 
-        print(f"✅ Content generated: {title}")
+    Returns:
+        list: Finished jobs (dictionaries with 'topic', 'title', 'published', ...).
+    """
+    import trends
+
+    topics = trend_history.rank_topics(trends.get_trending_topics(geo), geo)[:count]
+    if len(topics) < count:
+        print("⚠️ Not enough unique trending topics available for this batch.")
+
+    last_publish = [None]
+
+    def spaced_publish(job):
+        # Keep posts spaced out without holding up research and writing
+        if last_publish[0] is not None:
+            wait = last_publish[0] + publish_interval - time.monotonic()
+            if wait > 0:
+                print(f"Waiting {wait / 60:.1f} minutes before next post...")
+                time.sleep(wait)
+        job = publish_stage(job)
+        last_publish[0] = time.monotonic()
+        return job
+
+    engine = pipeline.Pipeline([
+        pipeline.Stage('research', research_stage, workers=RESEARCH_WORKERS),
+        pipeline.Stage('write', write_stage, workers=WRITE_WORKERS),
+        pipeline.Stage('publish', spaced_publish, workers=1),
+    ])
+    traces = []
+
+    def jobs():
+        for topic in topics:
+            trace = metrics.start_trace(topic['title'])
+            traces.append(trace)
+            yield new_job(topic, trace=trace)
 
-        # Publish
-        print("Cc Publishing to Blogger...")
-        success = publisher.publish_post(title, content)
+    try:
+        with parse_processes():
+            return engine.run(jobs())
+    finally:
+        for trace in traces:
+            metrics.finish_trace(trace)
 
-        if success:
-            print("🎉 Post published successfully!")
-        else:
-            print("❌ Publishing failed.")
+def resume_cycles(stages=artifacts.UNFINISHED_STAGES):
+    """
+    Carries every saved cycle in `stages` through its remaining stages.
+    The finished posts are published together in batched requests.
 
-    except Exception as e:
-        print(f"Error in post cycle: {e}")
+    Returns:
+        list: The finished jobs (cycles that stopped early are left out).
+    """
+    written = []
+    traces = []
+    try:
+        for cycle in artifacts.get_store().pending(stages):
+            trace = metrics.start_trace(cycle['topic']['title'])
+            traces.append(trace)
+            print(f"\n♻️ Resuming '{cycle['topic']['title']}' after the '{cycle['stage']}' stage.")
+            try:
+                job = job_from_cycle(cycle, trace)
+                for stage in (research_stage, write_stage):
+                    job = stage(job)
+                    if job is None:
+                        break
+                else:
+                    written.append(job)
+            except Exception as e:
+                print(f"Error resuming cycle {cycle['id']}: {e}")
+        return publish_jobs(written)
+    finally:
+        for trace in traces:
+            metrics.finish_trace(trace)
+
+def publish_pending():
+    """
+    Retries publishing posts that were written but never published.
+    """
+    return resume_cycles(stages=(artifacts.WRITTEN,))
+
+def run_backfill(geos, budget, is_draft=True, limiter=None):
+    """
+    Runs full post cycles for the current trends of several countries.
+
+    Topics from all of `geos` are ranked by momentum (rising topics first),
+    skipping anything already published. Topics keep being taken until
+    `budget` posts are written or the topics run out, so cycles skipped for
+    duplicates, missing material or failed generation don't use up budget.
+    Research, writing and publish batches (every BACKFILL_PUBLISH_BATCH
+    written posts) share an AIMD concurrency limit: it grows while every
+    upstream keeps up and halves when the fetch, Gemini or Blogger stage
+    reports a 429 or timeout.
+
+    Returns:
+        list: Finished jobs, in topic rank order.
+    """
+    import trends
+
+    topics = trend_history.rank_topics(trends.get_trending_topics_multi(geos))
+    if not topics:
+        print("No new trending topics to backfill.")
+        return []
+    print(f"Backfilling up to {budget} posts from {', '.join(geos)} ({len(topics)} candidate topics)...")
+
+    limiter = limiter or ratelimit.AIMDLimiter(BACKFILL_CONCURRENCY, maximum=BACKFILL_MAX_CONCURRENCY)
+
+    def cycle(topic, token):
+        try:
+            return run_post_cycle(topic, geo=topic.get('geo', geos[0]), is_draft=is_draft, publish=False)
+        finally:
+            limiter.release(token)
+
+    def publish_batch(batch, token):
+        try:
+            return publish_jobs(batch)
+        finally:
+            limiter.release(token)
+
+    candidates = iter(enumerate(topics))
+    written, unpublished = [], []
+    # future -> topic position, or None for a publish batch
+    running = {}
+    ratelimit.add_overload_listener(limiter.backoff)
+    try:
+        with parse_processes(), ThreadPoolExecutor(max_workers=limiter.maximum) as pool:
+            while True:
+                cycles = sum(1 for position in running.values() if position is not None)
+                # Start cycles only while they could still be needed to fill the budget
+                while len(written) + cycles < budget:
+                    position, topic = next(candidates, (None, None))
+                    if topic is None:
+                        break
+                    token = limiter.acquire()
+                    running[pool.submit(cycle, topic, token)] = position
+                    cycles += 1
+                if unpublished and (len(unpublished) >= BACKFILL_PUBLISH_BATCH or not cycles):
+                    token = limiter.acquire()
+                    running[pool.submit(publish_batch, unpublished, token)] = None
+                    unpublished = []
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position = running.pop(future)
+                    job = future.result()
+                    if position is not None and job:
+                        written.append((position, job))
+                        unpublished.append(job)
+    finally:
+        ratelimit.remove_overload_listener(limiter.backoff)
+
+    jobs = [job for _, job in sorted(written, key=lambda entry: entry[0])]
+    published = sum(1 for job in jobs if job.get('published'))
+    print(f"Backfill done: {published} of {budget} posts saved "
+          f"(final concurrency {limiter.concurrency}, {limiter.backoffs} backoffs).")
+    return jobs
+
+def choose_topic(exclude=(), geo='US'):
+    """
+    Returns the fastest rising topic that is neither published nor in `exclude`.
+    """
+    import trends
+
+    for topic in trend_history.rank_topics(trends.get_trending_topics(geo), geo):
+        if topic['title'] not in exclude:
+            return topic
+    return None
+
+def run_scheduled():
+    """
+    Interactive front end for the persistent scheduler (menu option 2).
+    Resumes unfinished jobs from an earlier run, otherwise plans a new batch.
+    """
+    sched = scheduler.Scheduler()
+    pending = sched.jobs()
+
+    if pending:
+        print(f"Resuming {len(pending)} scheduled posts from the last run.")
+    else:
+        try:
+            count = int(input("How many posts do you want to publish today? "))
+            hours = float(input("Over how many hours? ") or 12)
+        except ValueError:
+            print("Invalid number.")
+            sched.close()
+            return
+        if count <= 0:
+            sched.close()
+            return
+        sched.plan(count, hours * 3600)
+        print(f"Scheduling {count} posts over {hours:g} hours...")
+
+    run_schedule(sched)
+
+def run_schedule(sched, geo='US'):
+    """
+    Runs the scheduler's queue to completion, choosing topics for open slots
+    just before they are prepared. Ctrl+C stops it; progress is kept.
+
+    Returns:
+        list: The jobs that were queued when it started, in their final state.
+    """
+    queued = {job['id'] for job in sched.jobs()}
+    claimed = set()
+    claim_lock = threading.Lock()
+
+    def prepare(job):
+        topic = job['topic']
+        if not topic:
+            with claim_lock:
+                taken = claimed | {j['topic']['title'] for j in sched.jobs() if j['topic']}
+                topic = choose_topic(exclude=taken, geo=geo)
+                if not topic:
+                    print("⚠️ No more unique trending topics available.")
+                    return None
+                claimed.add(topic['title'])
+
+        prepared = research_stage({'topic': topic})
+        prepared = write_stage(prepared) if prepared else None
+        if not prepared:
+            return None
+        return {'topic': topic, 'title': prepared['title'], 'content': prepared['content'],
+                'labels': prepared.get('labels')}
+
+    def publish(job):
+        return publish_stage(dict(job))['published']
+
+    print("Scheduler running. Press Ctrl+C to stop; progress is saved.")
+    try:
+        sched.run(prepare, publish)
+        print("Batch complete.")
+    except KeyboardInterrupt:
+        print("\nStopped. Run again to resume.")
+    finally:
+        jobs = [job for job in sched.jobs(scheduler.ACTIVE_STATES + scheduler.DONE_STATES) if job['id'] in queued]
+        sched.close()
+    return jobs
 
 def main():
+    """
+    Interactive menu.
+    """
+    import publisher
+    import trends
+
     if not setup_environment():
         print("Exiting setup.")
         return
@@ -128,7 +575,7 @@ def main():
             topic_list = trends.get_trending_topics()
             print("\nTop Trending Topics:")
             for i, t in enumerate(topic_list[:10], 1):
-                print(f"{i}. {t['title']} ({t['traffic']})")
+                print(f"{i}. {t['title']} ({t['traffic']:,}+)")
 
             sel = input("\nEnter number to post (or 0 to cancel): ")
             try:
@@ -143,50 +590,256 @@ def main():
                 print("Invalid input.")
 
         elif choice == '2':
-            try:
-                count = int(input("How many posts do you want to publish today? "))
-                print(f"Scheduling {count} posts for today...")
-
-                # Calculate interval
-                # Assuming "today" means next 12 hours or 24 hours?
-                # Let's simple loop: publish one now, then sleep appropriately.
-                # Or use 'schedule' library to space them out.
-
-                # For simplicity in this session:
-                if count > 0:
-                    print("Starting loop. Press Ctrl+C to stop.")
-
-                    # Get all trends once or fetch fresh each time?
-                    # Fetching fresh is better.
-
-                    for i in range(count):
-                        print(f"\n--- Processing Post {i+1}/{count} ---")
-
-                        # Fetch trends
-                        all_trends = trends.get_trending_topics()
-                        # Pick the i-th trend to avoid duplicates if possible,
-                        # or pick random?
-                        # Using i-th trend from the list might work if list is long enough.
-                        if i < len(all_trends):
-                            target_trend = all_trends[i]
-                            run_post_cycle(target_trend)
-                        else:
-                            print("⚠️ No more unique trending topics available for this batch.")
-                            break
-
-                        if i < count - 1:
-                            wait_min = 60 # wait 1 hour between posts?
-                            # User might want faster.
-                            print(f"Waiting 10 minutes before next post...")
-                            time.sleep(600)
-
-                print("Batch complete.")
-
-            except ValueError:
-                print("Invalid number.")
+            run_scheduled()
 
         elif choice == '3':
             sys.exit()
 
+def load_config(path):
+    """
+    Reads CLI settings from a JSON file. A missing file means no settings.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Auto Blogspot Poster. Run without a command for the interactive menu."
+    )
+    parser.add_argument('--config', default=CONFIG_FILE,
+                        help=f"JSON file with default settings (default: {CONFIG_FILE})")
+    parser.add_argument('--metrics',
+                        help="Write stage timings and counters here on exit "
+                             "(.prom for Prometheus text, otherwise JSON lines)")
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser('list-trends', help="Print the current trending topics")
+    p.add_argument('--geo', help="Country code (default: US)")
+    p.add_argument('--limit', type=int, help="Number of topics to show (default: 10)")
+
+    p = commands.add_parser('post', help="Research, write and publish one post")
+    p.add_argument('--topic', help="Topic title (default: top trending topic)")
+    p.add_argument('--geo', help="Country code (default: US)")
+    p.add_argument('--draft', action='store_true', default=None, help="Save as draft")
+
+    p = commands.add_parser('run-batch', help="Publish several trending topics")
+    p.add_argument('--count', type=int, help="Number of posts")
+    p.add_argument('--hours', type=float,
+                   help="Spread the posts over this many hours with the persistent scheduler")
+    p.add_argument('--interval', type=float, help="Seconds between posts when not scheduling")
+    p.add_argument('--geo', help="Country code (default: US)")
+
+    p = commands.add_parser('backfill', help="Write posts for the current trends of several countries")
+    p.add_argument('--geos', help="Comma-separated country codes, e.g. US,GB,IN")
+    p.add_argument('--budget', type=int, help="Maximum number of posts")
+    p.add_argument('--publish', action='store_true', default=None,
+                   help="Publish the posts instead of saving drafts")
+
+    p = commands.add_parser('run-blogs', help="Publish to several blogs from shared research")
+    p.add_argument('--blogs', help="JSON file listing the blogs (default: blogs.json)")
+    p.add_argument('--workers', type=int, help="Threads shared by all blogs (default: 4)")
+
+    commands.add_parser('resume', help="Finish post cycles interrupted by a crash or failed publish")
+    commands.add_parser('publish-pending', help="Retry publishing posts that were written but not published")
+    commands.add_parser('cancel-schedule', help="Drop every scheduled post that has not been published")
+
+    commands.add_parser('doctor', help="Check configuration and measure startup time")
+    return parser
+
+def setting(args, config, name, default=None):
+    """
+    Resolves a setting: command-line flag, then config file, then default.
+    """
+    value = getattr(args, name, None)
+    if value is not None:
+        return value
+    return config.get(name, default)
+
+def configure_from_settings(config):
+    """
+    Non-interactive AI setup: API key from the config file or GOOGLE_API_KEY.
+    A 'search_url' setting points the research fallback at a JSON search endpoint.
+    """
+    import search
+    import writer
+
+    if config.get('search_url'):
+        search.set_provider(search.JsonApiProvider(config['search_url']))
+
+    try:
+        writer.configure_ai(config.get('api_key') or os.environ.get('GOOGLE_API_KEY'))
+        return True
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+
+def cmd_list_trends(args, config):
+    import trends
+
+    topics = trends.get_trending_topics(setting(args, config, 'geo', 'US'))
+    for i, t in enumerate(topics[:setting(args, config, 'limit', 10)], 1):
+        print(f"{i}. {t['title']} ({t['traffic']:,}+)")
+    return 0 if topics else 1
+
+def cmd_post(args, config):
+    if not configure_from_settings(config):
+        return 2
+    topic = {'title': args.topic, 'news_items': []} if args.topic else None
+    job = run_post_cycle(topic, geo=setting(args, config, 'geo', 'US'),
+                         is_draft=bool(setting(args, config, 'draft', False)))
+    return 0 if job and job['published'] else 1
+
+def cmd_run_batch(args, config):
+    if not configure_from_settings(config):
+        return 2
+    geo = setting(args, config, 'geo', 'US')
+    count = setting(args, config, 'count')
+    hours = setting(args, config, 'hours')
+
+    if hours is not None:
+        sched = scheduler.Scheduler()
+        pending = sched.jobs()
+        if pending:
+            print(f"Resuming {len(pending)} scheduled posts from the last run.")
+        elif count:
+            sched.plan(count, hours * 3600)
+        else:
+            sched.close()
+            print("❌ --count is required.")
+            return 2
+        jobs = run_schedule(sched, geo=geo)
+        return 0 if jobs and all(job['state'] == scheduler.PUBLISHED for job in jobs) else 1
+
+    if not count:
+        print("❌ --count is required.")
+        return 2
+    jobs = run_batch(count, setting(args, config, 'interval', PUBLISH_INTERVAL), geo=geo)
+    # Fewer posts than asked for (e.g. not enough topics) is a failed batch
+    published = sum(1 for job in jobs if job['published'])
+    return 0 if published >= count else 1
+
+def cmd_backfill(args, config):
+    if not configure_from_settings(config):
+        return 2
+    geos = setting(args, config, 'geos')
+    budget = setting(args, config, 'budget')
+    if isinstance(geos, str):
+        geos = [geo.strip().upper() for geo in geos.split(',') if geo.strip()]
+    if not geos or not budget:
+        print("❌ --geos and --budget are required.")
+        return 2
+    jobs = run_backfill(geos, budget, is_draft=not setting(args, config, 'publish', False))
+    return 0 if jobs and all(job['published'] for job in jobs) else 1
+
+def cmd_run_blogs(args, config):
+    import fanout
+
+    if not configure_from_settings(config):
+        return 2
+    blogs = fanout.load_blogs(setting(args, config, 'blogs', fanout.BLOGS_FILE))
+    results = fanout.FanOut(blogs, setting(args, config, 'workers', fanout.WORKERS)).run()
+    return 0 if all(r['published'] for r in results) else 1
+
+def cmd_resume(args, config):
+    if not configure_from_settings(config):
+        return 2
+    pending = len(artifacts.get_store().pending())
+    if not pending:
+        print("Nothing to resume.")
+        return 0
+    jobs = resume_cycles()
+    return 0 if len(jobs) == pending and all(job['published'] for job in jobs) else 1
+
+def cmd_publish_pending(args, config):
+    pending = len(artifacts.get_store().pending((artifacts.WRITTEN,)))
+    if not pending:
+        print("No posts waiting to be published.")
+        return 0
+    jobs = publish_pending()
+    published = sum(1 for job in jobs if job['published'])
+    print(f"Published {published} of {pending} pending posts.")
+    return 0 if published == pending else 1
+
+def cmd_cancel_schedule(args, config):
+    sched = scheduler.Scheduler()
+    try:
+        dropped = sched.cancel_all()
+    finally:
+        sched.close()
+    print(f"Cancelled {dropped} scheduled posts." if dropped else "No scheduled posts to cancel.")
+    return 0
+
+def cmd_doctor(args, config):
+    ok = True
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.abspath(__file__), '--help'],
+                   stdout=subprocess.DEVNULL, check=False)
+    startup = time.perf_counter() - start
+    status = "✅" if startup <= STARTUP_BUDGET else "⚠️"
+    print(f"{status} CLI startup: {startup * 1000:.0f} ms (budget {STARTUP_BUDGET * 1000:.0f} ms)")
+
+    for module in HEAVY_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            print(f"✅ {module} imports in {(time.perf_counter() - start) * 1000:.0f} ms")
+        except ImportError as e:
+            print(f"❌ {module}: {e}")
+            ok = False
+
+    if config.get('api_key') or os.environ.get('GOOGLE_API_KEY'):
+        print("✅ Google API key found.")
+    else:
+        print("❌ No Google API key (set GOOGLE_API_KEY or 'api_key' in the config file).")
+        ok = False
+
+    if os.path.exists('client_secret.json'):
+        print("✅ client_secret.json found.")
+    else:
+        print("❌ client_secret.json not found.")
+        ok = False
+
+    if os.path.exists('token.pickle'):
+        print("✅ Blogger token found.")
+    else:
+        print("⚠️ No Blogger token yet; the first publish will open a browser to sign in.")
+
+    return 0 if ok else 1
+
+COMMANDS = {
+    'list-trends': cmd_list_trends,
+    'post': cmd_post,
+    'run-batch': cmd_run_batch,
+    'backfill': cmd_backfill,
+    'run-blogs': cmd_run_blogs,
+    'resume': cmd_resume,
+    'publish-pending': cmd_publish_pending,
+    'cancel-schedule': cmd_cancel_schedule,
+    'doctor': cmd_doctor,
+}
+
+def cli(argv=None):
+    """
+    Non-interactive entry point. Returns the process exit code.
+    """
+    args = build_parser().parse_args(argv)
+    if not args.command:
+        main()
+        return 0
+    try:
+        config = load_config(args.config)
+    except ValueError as e:
+        print(f"❌ Invalid config file {args.config}: {e}")
+        return 2
+    try:
+        return COMMANDS[args.command](args, config)
+    finally:
+        path = setting(args, config, 'metrics')
+        if path:
+            metrics.export(path)
+
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())
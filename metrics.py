@@ -0,0 +1,192 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# Number of finished cycle traces kept in memory
+MAX_TRACES = 100
+
+# Prefix of every exported metric name
+PREFIX = 'autopost'
+
+class Registry:
+    """
+    Thread-safe store of stage latency histograms and labelled counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # stage -> {'buckets': [...], 'count': n, 'sum': s}
+        self._counters = {}    # (name, ((label, value), ...)) -> total
+        self.traces = deque(maxlen=MAX_TRACES)
+
+    def observe(self, stage, seconds):
+        """
+        Records one latency sample for `stage`.
+        """
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0}
+                self._histograms[stage] = hist
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            hist['count'] += 1
+            hist['sum'] += seconds
+
+    def incr(self, name, value=1, **labels):
+        """
+        Adds `value` to the counter `name` with the given labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self):
+        """
+        Returns all metrics as a JSON-serialisable dictionary.
+        """
+        with self._lock:
+            stages = {}
+            for stage, hist in self._histograms.items():
+                stages[stage] = {
+                    'count': hist['count'],
+                    'sum': round(hist['sum'], 6),
+                    'buckets': {_bound(b): n for b, n in zip(BUCKETS, hist['buckets'])}
+                }
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        return {'time': time.time(), 'stages': stages, 'counters': counters}
+
+    def to_prometheus(self):
+        """
+        Renders all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            if self._histograms:
+                name = f'{PREFIX}_stage_seconds'
+                lines.append(f'# HELP {name} Latency of each pipeline stage.')
+                lines.append(f'# TYPE {name} histogram')
+                for stage, hist in sorted(self._histograms.items()):
+                    cumulative = 0
+                    for bound, n in zip(BUCKETS, hist['buckets']):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{_bound(bound)}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {hist["sum"]:.6f}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {hist["count"]}')
+
+            declared = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                full = f'{PREFIX}_{name}_total'
+                if full not in declared:
+                    lines.append(f'# TYPE {full} counter')
+                    declared.add(full)
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f'{full}{{{label_text}}} {value}' if label_text else f'{full} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.traces.clear()
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+class Trace:
+    """
+    Timeline of the stages one post cycle went through.
+    """
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, seconds, error=None):
+        with self._lock:
+            self.spans.append({
+                'stage': stage,
+                'offset': round(start - self.started, 6),
+                'seconds': round(seconds, 6),
+                'error': error
+            })
+
+    def to_dict(self):
+        with self._lock:
+            return {'id': self.id, 'name': self.name, 'started': self.started, 'spans': list(self.spans)}
+
+_registry = Registry()
+
+def get_registry():
+    return _registry
+
+def observe(stage, seconds):
+    _registry.observe(stage, seconds)
+
+def incr(name, value=1, **labels):
+    _registry.incr(name, value, **labels)
+
+@contextmanager
+def timed(stage, trace=None):
+    """
+    Times the enclosed block as `stage`. Exceptions are counted as errors of
+    that stage and re-raised. If `trace` is given, a span is added to it.
+    """
+    wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e.__class__.__name__
+        _registry.incr('errors', stage=stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _registry.observe(stage, seconds)
+        if trace is not None:
+            trace.add(stage, wall, seconds, error)
+
+def start_trace(name):
+    return Trace(name)
+
+def finish_trace(trace):
+    """
+    Keeps a finished trace for export.
+    """
+    _registry.traces.append(trace)
+
+def export(path):
+    """
+    Writes the current metrics to `path`.
+
+    A `.prom` file is overwritten with Prometheus text; anything else gets one
+    JSON line with the metrics snapshot and the traces collected so far.
+    """
+    if path.endswith('.prom'):
+        with open(path, 'w') as f:
+            f.write(_registry.to_prometheus())
+        return
+
+    snapshot = _registry.snapshot()
+    snapshot['traces'] = [trace.to_dict() for trace in list(_registry.traces)]
+    with open(path, 'a') as f:
+        f.write(json.dumps(snapshot) + '\n')
@@ -0,0 +1,123 @@
+import queue
+import threading
+
+# Default capacity of the queue in front of each stage
+QUEUE_SIZE = 4
+
+_DONE = object()
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Args:
+        name (str): Label used in log messages.
+        func (callable): Takes one item and returns the item for the next stage,
+                         or None to drop it.
+        workers (int): Number of threads running `func` concurrently.
+        queue_size (int): Capacity of the input queue (defaults to the pipeline's).
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+
+class Pipeline:
+    """
+    Runs items through a chain of stages, each in its own worker threads.
+
+    Stages are connected by bounded queues, so a slow stage makes earlier
+    stages block instead of piling up results in memory. Sustained
+    throughput is set by the slowest stage rather than the sum of all.
+    """
+
+    def __init__(self, stages, queue_size=QUEUE_SIZE):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items, on_result=None):
+        """
+        Feeds `items` through every stage and waits for them to finish.
+
+        Args:
+            items (iterable): Input items, consumed lazily.
+            on_result (callable): Optional callback for each item leaving the last stage.
+
+        Returns:
+            list: Items that made it through every stage, in completion order.
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size or self.queue_size) for stage in self.stages]
+        out = queue.Queue()
+        queues.append(out)
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(stage, queues[index], queues[index + 1], remaining, lock),
+                    name=f"{stage.name}-{n}",
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+
+        feeder = threading.Thread(target=self._feed, args=(items, queues[0], self.stages[0].workers), daemon=True)
+        feeder.start()
+
+        results = []
+        while True:
+            item = out.get()
+            if item is _DONE:
+                break
+            results.append(item)
+            if on_result:
+                on_result(item)
+
+        feeder.join()
+        for t in threads:
+            t.join()
+        return results
+
+    @staticmethod
+    def _feed(items, inbox, workers):
+        try:
+            for item in items:
+                inbox.put(item)
+        finally:
+            for _ in range(workers):
+                inbox.put(_DONE)
+
+    def _worker(self, stage, inbox, outbox, remaining, lock):
+        next_workers = self._next_workers(stage)
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                print(f"Error in {stage.name} stage: {e}")
+                continue
+            if result is not None:
+                outbox.put(result)
+
+        # The last worker of a stage to finish tells the next stage to stop
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                outbox.put(_DONE)
+
+    def _next_workers(self, stage):
+        index = self.stages.index(stage)
+        if index + 1 < len(self.stages):
+            return self.stages[index + 1].workers
+        return 1
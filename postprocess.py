@@ -0,0 +1,181 @@
+import re
+from collections import Counter
+
+from lxml import etree
+from lxml import html as lxml_html
+
+# Tags kept in published posts; any other tag is unwrapped and its text kept
+ALLOWED_TAGS = {
+    'p', 'h2', 'h3', 'h4', 'ul', 'ol', 'li', 'strong', 'em', 'b', 'i', 'u', 'a', 'br', 'hr',
+    'blockquote', 'code', 'pre', 'table', 'thead', 'tbody', 'tr', 'th', 'td', 'img', 'figure', 'figcaption'
+}
+
+# Tags removed together with everything inside them
+DROP_TAGS = {
+    'script', 'style', 'iframe', 'frame', 'object', 'embed', 'form', 'input', 'button', 'select',
+    'textarea', 'noscript', 'head', 'title', 'meta', 'link', 'base', 'svg', 'canvas'
+}
+
+# Attributes kept per tag; all others (class, style, on* handlers, ...) are dropped
+ALLOWED_ATTRS = {
+    'a': ('href', 'title'),
+    'img': ('src', 'alt', 'width', 'height'),
+    'td': ('colspan', 'rowspan'),
+    'th': ('colspan', 'rowspan'),
+}
+
+# Headings demoted so the post title stays the page's only h1
+RENAME_TAGS = {'h1': 'h2', 'h5': 'h4', 'h6': 'h4'}
+
+# Tags whose surrounding whitespace is insignificant
+BLOCK_TAGS = {
+    'p', 'h2', 'h3', 'h4', 'ul', 'ol', 'li', 'blockquote', 'pre', 'table', 'thead', 'tbody',
+    'tr', 'th', 'td', 'figure', 'figcaption', 'hr', 'div'
+}
+
+# Longest excerpt, in characters
+EXCERPT_CHARS = 300
+
+# Most labels attached to a post, and the longest single label
+MAX_LABELS = 5
+LABEL_CHARS = 50
+
+# Capitalised words that say nothing about the post's subject
+LABEL_STOPWORDS = {
+    'The', 'This', 'That', 'These', 'Those', 'There', 'Their', 'They', 'And', 'But', 'For', 'With',
+    'What', 'Why', 'How', 'When', 'Where', 'Who', 'While', 'After', 'Before', 'According', 'However',
+    'Overview', 'Introduction', 'Conclusion', 'Takeaway', 'Takeaways', 'Summary', 'Key', 'Here', 'Its'
+}
+
+FENCE = re.compile(r'```[A-Za-z]*')
+WHITESPACE = re.compile(r'\s+')
+CAPITALISED = re.compile(r'\b[A-Z][A-Za-z]{2,}\b')
+UNSAFE_URL = re.compile(r'^\s*(javascript|vbscript|data):', re.IGNORECASE)
+
+def clean_title(title):
+    """
+    Strips markdown emphasis, heading marks, quotes and extra whitespace from a title.
+    """
+    title = re.sub(r'[*_#`]+', '', title or '')
+    return WHITESPACE.sub(' ', title).strip().strip('"\'').strip()
+
+def process(html, topic=None):
+    """
+    Cleans generated post HTML in one walk over the parsed tree.
+
+    Markdown fences are removed, unsafe or layout tags are dropped or
+    unwrapped, attributes are whitelisted, whitespace is collapsed and empty
+    paragraphs are removed. On the way, the first paragraph becomes the
+    excerpt and frequently named subjects become labels.
+
+    Args:
+        html (str): Generated HTML, possibly wrapped in markdown fences.
+        topic (str): Trending topic the post is about; used as the first label.
+
+    Returns:
+        dict: 'content' (minified HTML), 'excerpt' (plain text) and 'labels' (list).
+    """
+    text = FENCE.sub('', html or '').strip()
+    if not text:
+        return {'content': '', 'excerpt': '', 'labels': derive_labels(topic, Counter())}
+
+    root = lxml_html.fragment_fromstring(text, create_parent='div')
+    drop, unwrap = [], []
+    names = Counter()
+    excerpt = None
+
+    # (element, inside <pre>) pairs, visited in document order
+    stack = [(child, False) for child in reversed(root)]
+    _collapse(root, False, names)
+    root.text = (root.text or '').lstrip() or None
+
+    while stack:
+        el, in_pre = stack.pop()
+        if not isinstance(el.tag, str) or el.tag.lower() in DROP_TAGS:
+            # Comments, processing instructions and dropped tags; their tail text stays
+            drop.append(el)
+            if el.tail and not in_pre:
+                el.tail = WHITESPACE.sub(' ', el.tail)
+                if el.tail == ' ' and (_is_block(el.getprevious()) or _is_block(el.getnext())):
+                    el.tail = None
+            if el.tail:
+                names.update(CAPITALISED.findall(el.tail))
+            continue
+
+        tag = RENAME_TAGS.get(el.tag.lower(), el.tag.lower())
+        el.tag = tag
+        allowed = ALLOWED_ATTRS.get(tag, ())
+        for name in list(el.attrib):
+            if name not in allowed or UNSAFE_URL.match(el.attrib[name]):
+                del el.attrib[name]
+
+        in_pre = in_pre or tag == 'pre'
+        _collapse(el, in_pre, names)
+        if tag in BLOCK_TAGS and not in_pre:
+            if el.text:
+                el.text = el.text.lstrip() or None
+            if el.tail and not el.tail.strip():
+                el.tail = None
+
+        if tag == 'p' and not len(el) and not el.text:
+            drop.append(el)
+            continue
+        if tag == 'p' and excerpt is None:
+            excerpt = WHITESPACE.sub(' ', el.text_content()).strip() or None
+        if tag not in ALLOWED_TAGS:
+            unwrap.append(el)
+
+        stack.extend((child, in_pre) for child in reversed(el))
+
+    for el in drop:
+        el.drop_tree()
+    for el in reversed(unwrap):
+        el.drop_tag()
+
+    parts = [root.text or '']
+    parts.extend(etree.tostring(child, encoding='unicode', method='html') for child in root)
+    return {
+        'content': ''.join(parts).strip(),
+        'excerpt': _truncate(excerpt or '', EXCERPT_CHARS),
+        'labels': derive_labels(topic, names)
+    }
+
+def _collapse(el, in_pre, names):
+    if not in_pre:
+        if el.text:
+            el.text = WHITESPACE.sub(' ', el.text)
+        if el.tail:
+            el.tail = WHITESPACE.sub(' ', el.tail)
+    if el.text:
+        names.update(CAPITALISED.findall(el.text))
+    if el.tail:
+        names.update(CAPITALISED.findall(el.tail))
+
+def _is_block(el):
+    # Missing neighbours count as blocks: whitespace at the edge of a parent is insignificant
+    return el is None or not isinstance(el.tag, str) or el.tag.lower() in BLOCK_TAGS | DROP_TAGS
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0].rstrip(',;:') + '…'
+
+def derive_labels(topic, names):
+    """
+    Picks up to MAX_LABELS labels: the topic, then the capitalised names
+    mentioned at least twice, most frequent first.
+    """
+    labels = []
+    seen = set()
+    if topic and topic.strip():
+        label = _truncate(WHITESPACE.sub(' ', topic).strip(), LABEL_CHARS)
+        labels.append(label)
+        seen.update(word.lower() for word in label.split())
+    for name, count in names.most_common():
+        if len(labels) >= MAX_LABELS or count < 2:
+            break
+        if name in LABEL_STOPWORDS or name.lower() in seen:
+            continue
+        labels.append(name)
+        seen.add(name.lower())
+    return labels
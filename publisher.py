@@ -1,47 +1,60 @@
 import os
-import pickle
 import json
+import threading
+import uuid
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 
+import metrics
+import ratelimit
+import token_store
+
 # Scopes required for Blogger
 SCOPES = ['https://www.googleapis.com/auth/blogger']
 
-def get_credentials(client_secret_file='client_secret.json'):
+# Refresh the access token this long before it actually expires
+REFRESH_MARGIN = token_store.REFRESH_MARGIN
+
+# Maximum number of posts sent in one batch HTTP request
+BATCH_SIZE = 50
+
+def get_credentials(client_secret_file='client_secret.json', token_file='token.pickle'):
     """
-    Gets valid user credentials from storage.
+    Gets valid user credentials from the shared token store.
     If nothing is stored, it logs the user in via browser.
     """
-    creds = None
-    token_file = 'token.pickle'
-
-    if os.path.exists(token_file):
-        with open(token_file, 'rb') as token:
-            creds = pickle.load(token)
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Error refreshing token: {e}. Re-authenticating...")
-                creds = None
-
-        if not creds:
-            if not os.path.exists(client_secret_file):
-                print(f"Error: {client_secret_file} not found.")
-                print("Please download your OAuth 2.0 Client ID JSON from Google Cloud Console")
-                print("and save it as 'client_secret.json' in this directory.")
-                return None
+    def login():
+        if not os.path.exists(client_secret_file):
+            print(f"Error: {client_secret_file} not found.")
+            print("Please download your OAuth 2.0 Client ID JSON from Google Cloud Console")
+            print("and save it as 'client_secret.json' in this directory.")
+            return None
 
-            flow = InstalledAppFlow.from_client_secrets_file(client_secret_file, SCOPES)
-            creds = flow.run_local_server(port=0)
+        flow = InstalledAppFlow.from_client_secrets_file(client_secret_file, SCOPES)
+        return flow.run_local_server(port=0)
 
-        with open(token_file, 'wb') as token:
-            pickle.dump(creds, token)
+    return token_store.get_store(token_file).get(login)
 
-    return creds
+def post_body(title, content, labels=None):
+    """
+    Builds the posts.insert request body. Empty fields are left out to keep it small.
+    """
+    body = {'title': title, 'content': content}
+    if labels:
+        body['labels'] = list(labels)
+    return body
+
+def is_overload_error(error):
+    """
+    True for errors meaning Blogger wants us to slow down: HTTP 429, a
+    403 rate-limit reason, or a timeout.
+    """
+    if isinstance(error, TimeoutError):
+        return True
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status == 429:
+        return True
+    return status == 403 and 'ratelimitexceeded' in str(error).lower()
 
 def get_blog_id(service):
     """
@@ -78,48 +91,239 @@ def get_blog_id(service):
         print(f"Error fetching blogs: {e}")
         return None
 
-def publish_post(title, content, is_draft=False):
+class BloggerClient:
     """
-    Publishes a post to Blogger.
+    Long-lived Blogger API client.
+
+    Credentials, the API service (built from the bundled static discovery
+    document) and the blog id are loaded once and reused, so each publish
+    only costs the posts.insert round trip.
     """
-    creds = get_credentials()
-    if not creds:
-        return False
 
-    try:
-        service = build('blogger', 'v3', credentials=creds)
+    def __init__(self, client_secret_file='client_secret.json', token_file='token.pickle',
+                 config_file='blog_config.json', blog_id=None):
+        self.client_secret_file = client_secret_file
+        self.token_file = token_file
+        self.config_file = config_file
+        self._blog_id = blog_id
+        self._creds = None
+        self._service = None
+        self._lock = threading.RLock()
+
+    def credentials(self):
+        """
+        Returns cached credentials, going back to the token store shortly
+        before they expire. If the store hands back a different credentials
+        object (refreshed by another process), the service is rebuilt with it.
+        """
+        with self._lock:
+            if self._creds is None or token_store.needs_refresh(self._creds, REFRESH_MARGIN):
+                creds = get_credentials(self.client_secret_file, self.token_file)
+                if creds is not self._creds:
+                    self._service = None
+                self._creds = creds
+            return self._creds
+
+    def service(self):
+        """
+        Returns the Blogger service, building it on first use.
+        The same service (and its HTTP transport) is reused afterwards.
+        """
+        with self._lock:
+            creds = self.credentials()
+            if not creds:
+                return None
+            if self._service is None:
+                self._service = build('blogger', 'v3', credentials=creds,
+                                      static_discovery=True, cache_discovery=False)
+            return self._service
+
+    def blog_id(self):
+        """
+        Returns the target blog id from memory, blog_config.json or the API (in that order).
+        """
+        with self._lock:
+            if self._blog_id:
+                return self._blog_id
+
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r') as f:
+                    self._blog_id = json.load(f).get('blog_id')
+
+            if not self._blog_id:
+                service = self.service()
+                if not service:
+                    return None
+                self._blog_id = get_blog_id(service)
+                if self._blog_id:
+                    with open(self.config_file, 'w') as f:
+                        json.dump({'blog_id': self._blog_id}, f)
+
+            return self._blog_id
+
+    def publish(self, title, content, is_draft=False, labels=None):
+        """
+        Publishes a post to Blogger. Returns True on success.
+        """
+        try:
+            service = self.service()
+            if not service:
+                return False
+
+            blog_id = self.blog_id()
+            if not blog_id:
+                return False
+
+            body = post_body(title, content, labels)
+
+            with metrics.timed('publish'):
+                result = service.posts().insert(blogId=blog_id, body=body, isDraft=is_draft).execute()
+
+            print(f"Successfully published: {result.get('url')}")
+            return True
 
-        # We need a blog ID.
-        # For automation, we might want to store it, but for now lets fetch/ask once.
-        # Ideally, we cache this too.
-        blog_id = None
-        if os.path.exists('blog_config.json'):
-            with open('blog_config.json', 'r') as f:
-                blog_id = json.load(f).get('blog_id')
-
-        if not blog_id:
-            blog_id = get_blog_id(service)
-            if blog_id:
-                with open('blog_config.json', 'w') as f:
-                    json.dump({'blog_id': blog_id}, f)
-
-        if not blog_id:
+        except Exception as e:
+            if is_overload_error(e):
+                ratelimit.report_overload('publish')
+            print(f"An error occurred while publishing: {e}")
             return False
 
-        body = {
-            'title': title,
-            'content': content
+class PublishQueue:
+    """
+    Collects finished posts and sends them to Blogger in batched HTTP requests.
+
+    Usage:
+        queue = PublishQueue()
+        queue.add("Title", "<p>Body</p>", is_draft=True)
+        results = queue.flush()
+    """
+
+    def __init__(self, client=None, batch_size=BATCH_SIZE):
+        self.client = client or get_client()
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, title, content, is_draft=False, key=None, labels=None):
+        """
+        Queues a post. Returns the key used to report its result
+        (a unique id unless `key` is given; keys must not repeat within a flush).
+        """
+        with self._lock:
+            if key is None:
+                key = uuid.uuid4().hex
+            elif any(item['key'] == key for item in self._pending):
+                raise ValueError(f"Duplicate publish key: {key}")
+            self._pending.append({'key': key, 'title': title, 'content': content,
+                                  'is_draft': is_draft, 'labels': labels})
+            return key
+
+    def flush(self):
+        """
+        Sends all queued posts in groups of `batch_size`.
+
+        Returns:
+            list: One dictionary per post with 'key', 'title', 'success', 'url' and 'error'.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        if not pending:
+            return []
+
+        service = self.client.service()
+        blog_id = self.client.blog_id() if service else None
+        if not service or not blog_id:
+            return [self._result(item, error="Blogger client not available") for item in pending]
+
+        results = []
+        for i in range(0, len(pending), self.batch_size):
+            results.extend(self._send_batch(service, blog_id, pending[i:i + self.batch_size]))
+        return results
+
+    def _send_batch(self, service, blog_id, items):
+        by_key = {item['key']: item for item in items}
+        results = {}
+
+        def callback(request_id, response, exception):
+            item = by_key[request_id]
+            if exception is not None:
+                if is_overload_error(exception):
+                    ratelimit.report_overload('publish')
+                results[request_id] = self._result(item, error=str(exception))
+            else:
+                results[request_id] = self._result(item, url=response.get('url'))
+
+        batch = service.new_batch_http_request(callback=callback)
+        for item in items:
+            body = post_body(item['title'], item['content'], item['labels'])
+            batch.add(service.posts().insert(blogId=blog_id, body=body, isDraft=item['is_draft']),
+                      request_id=item['key'])
+
+        try:
+            with metrics.timed('publish_batch'):
+                batch.execute()
+        except Exception as e:
+            if is_overload_error(e):
+                ratelimit.report_overload('publish')
+            print(f"An error occurred while publishing batch: {e}")
+            for item in items:
+                results.setdefault(item['key'], self._result(item, error=str(e)))
+
+        ordered = [results.get(item['key']) or self._result(item, error="No response") for item in items]
+        for result in ordered:
+            if result['success']:
+                print(f"Successfully published: {result['url']}")
+            else:
+                print(f"Failed to publish '{result['title']}': {result['error']}")
+        return ordered
+
+    @staticmethod
+    def _result(item, url=None, error=None):
+        return {
+            'key': item['key'],
+            'title': item['title'],
+            'success': error is None,
+            'url': url,
+            'error': error
         }
 
-        posts = service.posts()
-        result = posts.insert(blogId=blog_id, body=body, isDraft=is_draft).execute()
+_default_client = None
+_default_client_lock = threading.Lock()
 
-        print(f"Successfully published: {result.get('url')}")
-        return True
+def get_client():
+    """
+    Returns the process-wide BloggerClient.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = BloggerClient()
+        return _default_client
 
-    except Exception as e:
-        print(f"An error occurred while publishing: {e}")
-        return False
+def publish_post(title, content, is_draft=False, labels=None):
+    """
+    Publishes a post to Blogger using the shared client.
+    """
+    return get_client().publish(title, content, is_draft=is_draft, labels=labels)
+
+def publish_posts(posts):
+    """
+    Publishes several posts with the shared client in batched requests.
+
+    Args:
+        posts (list): Dictionaries with 'title', 'content' and optional 'is_draft' and 'labels'.
+
+    Returns:
+        list: PublishQueue results, in the order of `posts`.
+    """
+    queue = PublishQueue()
+    for post in posts:
+        queue.add(post['title'], post['content'], is_draft=post.get('is_draft', False), labels=post.get('labels'))
+    return queue.flush()
 
 if __name__ == "__main__":
     # Test authentication
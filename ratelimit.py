@@ -0,0 +1,167 @@
+import threading
+import time
+
+import metrics
+
+# Seconds after a backoff during which further overload reports are ignored,
+# so one burst of 429s cuts the limit once rather than once per failing request
+BACKOFF_COOLDOWN = 5.0
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Args:
+        rate (float): Tokens added per `per` seconds (e.g. requests per minute).
+        per (float): Length of the rate window in seconds.
+        capacity (float): Burst size; defaults to `rate`.
+    """
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        if rate <= 0:
+            raise ValueError("Rate must be positive.")
+        self.rate = rate / per
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1, timeout=None):
+        """
+        Blocks until `amount` tokens are available and takes them.
+        Requests larger than the bucket are capped at its capacity.
+
+        Returns:
+            bool: True if acquired, False if `timeout` seconds passed first.
+        """
+        amount = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= amount:
+                    self._tokens -= amount
+                    return True
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    wait = (amount - self._tokens) / self.rate
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def pause(self, seconds):
+        """
+        Stops handing out tokens for `seconds` (e.g. after the upstream answered 429),
+        so every caller sharing the bucket backs off together.
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+class AIMDLimiter:
+    """
+    Concurrency limit with additive increase, multiplicative decrease.
+
+    Every request that finishes without an overload report raises the limit
+    by 1/limit (about +1 per round of requests); an overload report (a 429
+    or a timeout from an upstream) multiplies it by `decrease`. The limit
+    settles just below what the slowest upstream tolerates.
+
+    Args:
+        initial (int): Starting number of concurrent requests.
+        minimum (int): Lowest limit a backoff can reach.
+        maximum (int): Highest limit growth can reach.
+        decrease (float): Factor applied to the limit on overload.
+        cooldown (float): Seconds during which repeated overload reports are ignored.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16, decrease=0.5, cooldown=BACKOFF_COOLDOWN):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("Limits must satisfy 1 <= minimum <= initial <= maximum.")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(initial)
+        self.backoffs = 0
+        self._active = 0
+        self._last_backoff = None
+        self._cond = threading.Condition()
+
+    @property
+    def concurrency(self):
+        return int(self.limit)
+
+    def acquire(self):
+        """
+        Blocks until fewer than `concurrency` requests are running and takes a slot.
+
+        Returns:
+            int: Token to hand back to `release`.
+        """
+        with self._cond:
+            while self._active >= int(self.limit):
+                self._cond.wait()
+            self._active += 1
+            return self.backoffs
+
+    def release(self, token=None):
+        """
+        Frees a slot. The limit grows only if no backoff happened since the
+        slot was taken (`token` from acquire).
+        """
+        with self._cond:
+            self._active -= 1
+            if token == self.backoffs:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def backoff(self, source=None):
+        """
+        Cuts the limit after an overload, at most once per `cooldown` seconds.
+        """
+        with self._cond:
+            now = time.monotonic()
+            if self._last_backoff is not None and now - self._last_backoff < self.cooldown:
+                return
+            self._last_backoff = now
+            self.limit = max(float(self.minimum), self.limit * self.decrease)
+            self.backoffs += 1
+            print(f"Upstream overloaded{f' ({source})' if source else ''}; "
+                  f"concurrency down to {self.concurrency}.")
+
+_overload_listeners = []
+_overload_lock = threading.Lock()
+
+def add_overload_listener(callback):
+    """
+    Calls `callback(source)` whenever an upstream reports overload.
+    """
+    with _overload_lock:
+        _overload_listeners.append(callback)
+
+def remove_overload_listener(callback):
+    with _overload_lock:
+        if callback in _overload_listeners:
+            _overload_listeners.remove(callback)
+
+def report_overload(source):
+    """
+    Signals that an upstream answered 429 or timed out. `source` names the
+    stage (e.g. 'fetch', 'generate', 'publish').
+    """
+    metrics.incr('overloads', source=source)
+    with _overload_lock:
+        listeners = list(_overload_listeners)
+    for callback in listeners:
+        callback(source)
@@ -1,109 +1,400 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+import codecs
+import re
+import threading
 import time
 import random
 
+import cache
+import context
+import extractor
+import metrics
+import ratelimit
+import search
+
 # Headers to mimic a real browser to avoid being blocked
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Accept-Language': 'en-US,en;q=0.9',
 }
 
+# Upper bound on simultaneous page downloads across all hosts and threads
+MAX_WORKERS = 6
+
+# Maximum characters of extracted text kept per article
+MAX_CHARS = extractor.MAX_CHARS
+
+# Maximum bytes of page content read per URL
+MAX_BYTES = 1024 * 1024
+
+# Size of each read from a streamed response
+CHUNK_SIZE = 16 * 1024
+
+# Response codes telling us to slow down
+OVERLOAD_STATUSES = (429, 503)
+
+# Content types worth parsing; anything else is dropped before the body is read
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+
+_CHARSET = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+
+# SQLite file caching extracted article text (None disables the cache)
+ARTICLE_CACHE_PATH = 'article_cache.db'
+
+# Size limit of the article cache, in bytes of stored text
+ARTICLE_CACHE_BYTES = 50 * 1024 * 1024
+
+# Seconds before a cached article is revalidated with the origin
+ARTICLE_TTL = 6 * 60 * 60
+
+_article_cache = None
+_article_cache_lock = threading.Lock()
+
+# Prompt budget for the combined research context, in estimated tokens
+CONTEXT_TOKENS = context.TOKEN_BUDGET
+
+# Worker processes for HTML parsing in batch runs (0 parses in the fetching thread)
+PARSE_PROCESSES = 0
+
+# Good sources used per topic, and extra downloads started alongside them so
+# one slow or dead host does not hold the topic up
+SOURCES_WANTED = 3
+HEDGE_FETCHES = 2
+
+# Extracted text shorter than this only counts as a source if nothing better arrives
+MIN_SOURCE_CHARS = 200
+
+_WORD = re.compile(r'\w+')
+
+# Minimum delay (seconds) between two requests to the same host
+HOST_DELAY = (0.5, 1.5)
+
+_session = None
+_session_lock = threading.Lock()
+
+_download_slots = None
+
+_host_next = {}
+_host_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the shared requests.Session so TCP/TLS connections are reused
+    between fetches. Created lazily on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS * 2, pool_maxsize=MAX_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def download_slots():
+    """
+    Returns the semaphore shared by every download, so no more than
+    MAX_WORKERS pages are fetched at once however many fetch_first calls
+    run side by side. Created lazily on first use.
+    """
+    global _download_slots
+    with _session_lock:
+        if _download_slots is None:
+            _download_slots = threading.BoundedSemaphore(MAX_WORKERS)
+        return _download_slots
+
+def wait_for_host(url):
+    """
+    Blocks until it is polite to hit the host of `url` again.
+    Each host gets its own random delay, so different hosts never wait on each other.
+    """
+    host = urlparse(url).netloc.lower()
+    with _host_lock:
+        now = time.monotonic()
+        start = max(now, _host_next.get(host, now))
+        _host_next[host] = start + random.uniform(*HOST_DELAY)
+    delay = start - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
 def google_search(query, num_results=3):
     """
-    Performs a Google search and returns a list of URLs.
+    Searches the web for `query` and returns a list of URLs.
+
+    Goes through the shared search client (see search.py), which caches
+    results and merges several query variants. Google's result page is
+    scraped unless another provider was configured with search.set_provider.
     """
-    # Note: scraping Google Search results directly is against TOS and can be blocked.
-    # We will try to use the URLs provided by the Trends RSS first.
-    # If we must search, we use a basic search URL.
+    return search.get_client().search(query, num_results)
+
+def download(url, max_bytes=MAX_BYTES, etag=None, last_modified=None, stop=None):
+    """
+    Downloads a page, optionally as a conditional request.
+
+    The body is streamed: non-HTML responses are dropped after the headers,
+    and at most `max_bytes` of (decompressed) content is read. Setting the
+    `stop` event abandons the download; the page is then returned empty.
+    At most MAX_WORKERS downloads run at once across all threads.
+
+    Returns:
+        dict: 'status' (HTTP status, 0 on error), 'page' (HTML or ""),
+              'etag' and 'last_modified' (response validators, if any).
+    """
+    result = {'status': 0, 'page': "", 'etag': None, 'last_modified': None}
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
 
-    search_url = f"https://www.google.com/search?q={query.replace(' ', '+')}&num={num_results}"
     try:
-        response = requests.get(search_url, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"Failed to search Google: {response.status_code}")
-            return []
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        links = []
-
-        # This selector is fragile and changes often.
-        # Currently, look for generic search result containers.
-        # usually class 'g' -> 'a' href
-        for result in soup.select('.g a'):
-            link = result.get('href')
-            if link and link.startswith('http') and 'google.com' not in link:
-                links.append(link)
-                if len(links) >= num_results:
-                    break
-        return links
+        # per-host delay to be polite without stalling other hosts
+        wait_for_host(url)
+        with download_slots():
+            if stop is not None and stop.is_set():
+                return result
+            with metrics.timed('fetch'), get_session().get(url, timeout=10, stream=True, headers=headers) as response:
+                result['status'] = response.status_code
+                if response.status_code in OVERLOAD_STATUSES:
+                    ratelimit.report_overload('fetch')
+                if response.status_code != 200:
+                    return result
+
+                content_type = response.headers.get('Content-Type', '')
+                mime = content_type.split(';')[0].strip().lower()
+                if mime and mime not in HTML_TYPES:
+                    print(f"Skipping {url}: not HTML ({mime})")
+                    return result
+
+                result['etag'] = response.headers.get('ETag')
+                result['last_modified'] = response.headers.get('Last-Modified')
+                page = read_capped(response, content_type, max_bytes, stop)
+                if stop is not None and stop.is_set():
+                    return result
+                result['page'] = page
+                return result
+
     except Exception as e:
-        print(f"Error searching Google: {e}")
-        return []
+        if isinstance(e, requests.Timeout):
+            ratelimit.report_overload('fetch')
+        print(f"Error scraping {url}: {e}")
+        return result
+
+def read_capped(response, content_type, max_bytes=MAX_BYTES, stop=None):
+    """
+    Reads and decodes a streamed response body, stopping after `max_bytes`
+    or when the `stop` event is set.
+    Compressed bodies (gzip/deflate/br) are decompressed chunk by chunk.
+    """
+    decoder = None
+    parts = []
+    read = 0
+
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        if not chunk:
+            continue
+        chunk = chunk[:max_bytes - read]
+        read += len(chunk)
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(_guess_encoding(content_type, chunk))(errors='replace')
+        parts.append(decoder.decode(chunk))
+        if read >= max_bytes or (stop is not None and stop.is_set()):
+            break
+
+    if decoder is not None:
+        parts.append(decoder.decode(b'', final=True))
+    metrics.incr('bytes_fetched', read)
+    return ''.join(parts)
 
-def extract_text_from_url(url):
+def _guess_encoding(content_type, first_chunk):
+    """
+    Picks the charset from the Content-Type header, then a <meta> tag, then UTF-8.
+    """
+    match = _CHARSET.search(content_type) or _CHARSET.search(first_chunk[:2048].decode('ascii', 'ignore'))
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def get_article_cache():
+    """
+    Returns the shared on-disk article cache, or None if ARTICLE_CACHE_PATH is unset.
+    """
+    global _article_cache
+    with _article_cache_lock:
+        if _article_cache is None and ARTICLE_CACHE_PATH:
+            _article_cache = cache.DiskCache(ARTICLE_CACHE_PATH, ARTICLE_CACHE_BYTES)
+        return _article_cache
+
+def extract_text_from_url(url, parse_processes=0, stop=None):
     """
     Downloads the page and extracts the main text content.
+
+    Extracted text is cached per URL. Entries older than ARTICLE_TTL are
+    revalidated with ETag/Last-Modified, so an unchanged page is not
+    downloaded or parsed again; if revalidation fails, the stale text is
+    used. With `parse_processes` > 0 the HTML is parsed in extractor's
+    process pool. `stop` abandons the download.
     """
-    try:
-        # random sleep to be polite
-        time.sleep(random.uniform(0.5, 1.5))
+    store = get_article_cache()
+    entry = store.get(url, max_age=ARTICLE_TTL) if store else None
+    if entry and entry['fresh']:
+        metrics.incr('cache_hits', cache='article')
+        return entry['value']
+    metrics.incr('cache_misses', cache='article')
 
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        if response.status_code != 200:
-            return ""
+    if entry:
+        response = download(url, etag=entry['etag'], last_modified=entry['last_modified'], stop=stop)
+        if response['status'] == 304:
+            metrics.incr('cache_revalidated', cache='article')
+            store.touch(url)
+            return entry['value']
+        if not response['page']:
+            # Timeout, server error or abandoned fetch: the older text beats nothing
+            print(f"Using older cached text for {url}.")
+            return entry['value']
+    else:
+        response = download(url, stop=stop)
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+    with metrics.timed('extract'):
+        if response['page'] and parse_processes:
+            # Parsing is the CPU hot spot once fetching is concurrent; move it off this process
+            text = extractor.get_process_pool(parse_processes).submit(
+                extractor.extract_main_text, response['page'], MAX_CHARS).result()
+        else:
+            text = extractor.extract_main_text(response['page'], MAX_CHARS)
 
-        # Remove script and style elements
-        for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
-            script.decompose()
+    if text and store:
+        store.set(url, text, etag=response['etag'], last_modified=response['last_modified'])
+    return text
 
-        # Get text
-        text = soup.get_text(separator=' ')
+def rank_sources(topic, items):
+    """
+    Orders candidate sources by how well they match `topic`.
 
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
+    Args:
+        items (list): URLs, or news item dictionaries with 'url' and
+                      optionally 'title' and 'source'.
 
-        # Simple heuristic to get the "body": take the longest contiguous text block?
-        # Or just return everything (AI can filter it).
-        # Returning everything is safer but noisy.
-        # Let's truncate to first 5000 chars to avoid token limits if it's huge.
-        return text[:10000]
+    Returns:
+        list: The URLs, best match first. Ties keep their original order,
+              and a host already ranked is pushed behind new hosts.
+    """
+    words = set(_WORD.findall(topic.lower()))
+    scored = []
+    for position, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'url': item}
+        if not item.get('url'):
+            continue
+        score = 0.0
+        if words:
+            title = set(_WORD.findall((item.get('title') or '').lower()))
+            source = set(_WORD.findall((item.get('source') or '').lower()))
+            score = 2 * len(words & title) / len(words) + len(words & source) / len(words)
+        scored.append((score, position, item['url']))
+    scored.sort(key=lambda entry: (-entry[0], entry[1]))
 
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return ""
+    ranked, repeats, hosts = [], [], set()
+    for _, _, url in scored:
+        host = urlparse(url).netloc.lower()
+        (repeats if host in hosts else ranked).append(url)
+        hosts.add(host)
+    return ranked + repeats
 
-def research_topic(topic, provided_urls=None):
+def fetch_first(urls, wanted=SOURCES_WANTED, hedge=HEDGE_FETCHES, parse_processes=None):
+    """
+    Extracts text from `urls` (best first) until `wanted` of them give a good source.
+
+    `wanted + hedge` downloads start at once, and the next candidate starts
+    whenever one fails or comes back too short. As soon as `wanted` good
+    extractions are in, the downloads still running are abandoned, so the
+    slowest host no longer sets the research time. `parse_processes`
+    defaults to PARSE_PROCESSES as set when the call is made.
+
+    Returns:
+        list: Up to `wanted` (url, text) pairs, in the order of `urls`.
+    """
+    if not urls:
+        return []
+    if parse_processes is None:
+        parse_processes = PARSE_PROCESSES
+
+    stop = threading.Event()
+    candidates = iter(enumerate(urls))
+    running = {}
+    good, short = {}, {}
+
+    def _read(url):
+        print(f"Reading: {url}...")
+        return extract_text_from_url(url, parse_processes, stop)
+
+    pool = ThreadPoolExecutor(max_workers=min(MAX_WORKERS, wanted + hedge, len(urls)))
+
+    def launch():
+        for index, url in candidates:
+            running[pool.submit(_read, url)] = (index, url)
+            return
+
+    try:
+        for _ in range(wanted + hedge):
+            launch()
+        while running and len(good) < wanted:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, url = running.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    print(f"Error reading {url}: {e}")
+                    text = ""
+                if len(text) >= MIN_SOURCE_CHARS:
+                    good[index] = (url, text)
+                else:
+                    if text:
+                        short[index] = (url, text)
+                    launch()
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        if running:
+            metrics.incr('fetches_abandoned', len(running))
+
+    chosen = sorted(good)[:wanted]
+    chosen += sorted(short)[:wanted - len(chosen)]
+    picked = {**short, **good}
+    return [picked[index] for index in sorted(chosen)]
+
+def research_topic(topic, provided_urls=None, token_budget=CONTEXT_TOKENS):
     """
     Researches a topic by scraping provided URLs or searching for new ones.
-    Returns a string of combined context.
+
+    `provided_urls` may be plain URLs or the topic's news items; either way
+    the candidates are ranked by relevance and fetched with fetch_first.
+    Returns a string of combined context of at most `token_budget` (estimated) tokens.
     """
-    urls = provided_urls if provided_urls else []
+    urls = rank_sources(topic, provided_urls) if provided_urls else []
 
     # If no URLs provided, search
     if not urls:
         print(f"Searching for articles about: {topic}...")
-        urls = google_search(topic)
+        urls = google_search(topic, SOURCES_WANTED + HEDGE_FETCHES)
 
     if not urls:
         return "No information found."
 
-    combined_text = f"Research for Topic: {topic}\n\n"
-
-    count = 0
-    for url in urls:
-        if count >= 3: break # Limit to 3 articles
-        print(f"Reading: {url}...")
-        text = extract_text_from_url(url)
-        if text:
-            combined_text += f"--- Source: {url} ---\n{text}\n\n"
-            count += 1
+    sources = fetch_first(urls)
 
-    return combined_text
+    # Keep only the most relevant, non-repeated passages within the prompt budget
+    combined_text = context.assemble_context(topic, sources, token_budget)
+    return combined_text or "No information found."
 
 if __name__ == "__main__":
     # Test
@@ -0,0 +1,275 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# SQLite file holding the job queue
+SCHEDULE_PATH = 'schedule.db'
+
+# Seconds before a publish slot at which research and writing start
+LEAD_TIME = 15 * 60
+
+# Parallel job preparations (research + writing)
+PREPARE_WORKERS = 2
+
+# Topics tried for one slot before it is skipped
+MAX_PREPARE_TRIES = 3
+
+# Failed publishes are retried this many times, RETRY_DELAY seconds apart
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 5 * 60
+
+# On start, a first slot missed by more than this many seconds moves the remaining jobs later
+LATE_GRACE = 60
+
+# Longest single sleep, so a stop request or clock change is noticed
+MAX_SLEEP = 60
+
+# Job states
+SCHEDULED = 'scheduled'   # waiting for its preparation time
+PREPARING = 'preparing'   # research/writing in progress
+READY = 'ready'           # content generated, waiting for the publish slot
+PUBLISHED = 'published'
+SKIPPED = 'skipped'       # MAX_PREPARE_TRIES topics found nothing worth posting
+FAILED = 'failed'         # publishing failed MAX_ATTEMPTS times
+
+ACTIVE_STATES = (SCHEDULED, PREPARING, READY)
+DONE_STATES = (PUBLISHED, SKIPPED, FAILED)
+
+class Scheduler:
+    """
+    Persistent, deadline-based post scheduler.
+
+    Each job has a publish time. Preparation (research and writing) starts
+    LEAD_TIME seconds before it, in a small worker pool, so the post is
+    ready when its slot arrives. Jobs and generated content live in SQLite,
+    so after a restart the scheduler carries on where it stopped, moving
+    missed slots later rather than publishing them all at once.
+
+    Args:
+        path (str): SQLite file (":memory:" for a throwaway queue).
+        lead_time (float): Seconds of preparation ahead of each slot.
+        workers (int): Parallel preparations.
+    """
+
+    def __init__(self, path=SCHEDULE_PATH, lead_time=LEAD_TIME, workers=PREPARE_WORKERS):
+        self.lead_time = lead_time
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id INTEGER PRIMARY KEY,'
+            ' publish_at REAL NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' topic TEXT,'
+            ' title TEXT,'
+            ' content TEXT,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' error TEXT,'
+            ' labels TEXT)'
+        )
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'labels' not in columns:
+            # Queue created before labels were stored
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN labels TEXT')
+        # A preparation interrupted by a crash starts over
+        self._conn.execute('UPDATE jobs SET state = ? WHERE state = ?', (SCHEDULED, PREPARING))
+        self._conn.commit()
+
+    def plan(self, count, window, start=None, topics=None):
+        """
+        Spreads `count` posts evenly over `window` seconds.
+
+        Args:
+            count (int): Number of posts.
+            window (float): Length of the publishing window in seconds.
+            start (float): Unix time of the first slot (default: now).
+            topics (list): Optional topic dictionaries, one per slot. Slots
+                           without a topic get one chosen at preparation time.
+
+        Returns:
+            list: Ids of the new jobs.
+        """
+        start = time.time() if start is None else start
+        interval = window / count if count else 0
+        ids = []
+        with self._lock:
+            for i in range(count):
+                topic = topics[i] if topics and i < len(topics) else None
+                cursor = self._conn.execute(
+                    'INSERT INTO jobs (publish_at, state, topic) VALUES (?, ?, ?)',
+                    (start + i * interval, SCHEDULED, json.dumps(topic, default=dict) if topic else None)
+                )
+                ids.append(cursor.lastrowid)
+            self._conn.commit()
+        self._wake.set()
+        return ids
+
+    def jobs(self, states=ACTIVE_STATES):
+        """
+        Returns jobs in the given states, earliest slot first.
+        """
+        marks = ','.join('?' * len(states))
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT id, publish_at, state, topic, title, content, attempts, error, labels FROM jobs'
+                f' WHERE state IN ({marks}) ORDER BY publish_at', states
+            ).fetchall()
+        return [{
+            'id': row[0],
+            'publish_at': row[1],
+            'state': row[2],
+            'topic': json.loads(row[3]) if row[3] else None,
+            'title': row[4],
+            'content': row[5],
+            'attempts': row[6],
+            'error': row[7],
+            'labels': json.loads(row[8]) if row[8] else None
+        } for row in rows]
+
+    def _update(self, job_id, **fields):
+        if fields.get('topic') is not None:
+            fields['topic'] = json.dumps(fields['topic'], default=dict)
+        if fields.get('labels') is not None:
+            fields['labels'] = json.dumps(list(fields['labels']))
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            self._conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+            self._conn.commit()
+        self._wake.set()
+
+    def cancel_all(self):
+        """
+        Drops every job that has not been published yet.
+
+        Returns:
+            int: Number of jobs dropped.
+        """
+        marks = ','.join('?' * len(ACTIVE_STATES))
+        with self._lock:
+            cursor = self._conn.execute(f'DELETE FROM jobs WHERE state IN ({marks})', ACTIVE_STATES)
+            self._conn.commit()
+        return cursor.rowcount
+
+    def respace_overdue(self, now=None):
+        """
+        Moves the remaining jobs later if the first one's slot passed more
+        than LATE_GRACE seconds ago (e.g. the process was down), so they keep their
+        original gaps instead of being published back to back.
+
+        Returns:
+            float: Seconds the jobs were moved by (0 if nothing was overdue).
+        """
+        now = time.time() if now is None else now
+        marks = ','.join('?' * len(ACTIVE_STATES))
+        with self._lock:
+            first = self._conn.execute(
+                f'SELECT MIN(publish_at) FROM jobs WHERE state IN ({marks})', ACTIVE_STATES
+            ).fetchone()[0]
+            if first is None or now - first <= LATE_GRACE:
+                return 0
+            delay = now - first
+            self._conn.execute(
+                f'UPDATE jobs SET publish_at = publish_at + ? WHERE state IN ({marks})', (delay, *ACTIVE_STATES)
+            )
+            self._conn.commit()
+        print(f"Missed slots found; moving the remaining posts {delay / 60:.0f} minutes later.")
+        return delay
+
+    def stop(self):
+        """
+        Asks a running `run` loop to return after its current step.
+        """
+        self._stopping = True
+        self._wake.set()
+
+    def run(self, prepare, publish):
+        """
+        Works through the queue until no active jobs are left (or `stop` is called).
+        Jobs whose slots passed while nothing was running are re-spaced first.
+
+        Args:
+            prepare (callable): Takes a job dictionary and returns a dictionary with
+                                'topic', 'title', 'content' and optional 'labels',
+                                or None if the topic gave nothing. The slot is then
+                                tried again with its topic cleared, so a new one is
+                                chosen, and skipped after MAX_PREPARE_TRIES tries.
+            publish (callable): Takes a prepared job and returns True on success.
+        """
+        self._stopping = False
+        self.respace_overdue()
+        in_flight = set()
+
+        def _prepare(job):
+            result = None
+            for attempt in range(MAX_PREPARE_TRIES):
+                if attempt:
+                    print(f"Trying another topic for job {job['id']}.")
+                    job = dict(job, topic=None)
+                try:
+                    result = prepare(job)
+                except Exception as e:
+                    print(f"Error preparing job {job['id']}: {e}")
+                if result or self._stopping:
+                    break
+            if result:
+                fields = {'state': READY, 'title': result['title'], 'content': result['content']}
+                for name in ('topic', 'labels'):
+                    if result.get(name):
+                        fields[name] = result[name]
+                self._update(job['id'], **fields)
+            else:
+                self._update(job['id'], state=SKIPPED)
+            in_flight.discard(job['id'])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self._stopping:
+                self._wake.clear()
+                jobs = self.jobs()
+                if not jobs:
+                    break
+
+                now = time.time()
+                next_wake = now + MAX_SLEEP
+                for job in jobs:
+                    if job['state'] == SCHEDULED:
+                        start_at = job['publish_at'] - self.lead_time
+                        if now >= start_at and job['id'] not in in_flight:
+                            in_flight.add(job['id'])
+                            self._update(job['id'], state=PREPARING)
+                            pool.submit(_prepare, job)
+                        else:
+                            next_wake = min(next_wake, start_at)
+                    elif job['state'] == READY:
+                        if now >= job['publish_at']:
+                            self._publish(job, publish)
+                            if self._stopping:
+                                break
+                        else:
+                            next_wake = min(next_wake, job['publish_at'])
+
+                self._wake.wait(max(0, next_wake - time.time()))
+
+    def _publish(self, job, publish):
+        try:
+            success = publish(job)
+            error = None if success else "Publishing failed."
+        except Exception as e:
+            success, error = False, str(e)
+
+        if success:
+            self._update(job['id'], state=PUBLISHED, attempts=job['attempts'] + 1, error=None)
+        elif job['attempts'] + 1 >= MAX_ATTEMPTS:
+            self._update(job['id'], state=FAILED, attempts=job['attempts'] + 1, error=error)
+        else:
+            print(f"Retrying job {job['id']} in {RETRY_DELAY // 60} minutes.")
+            self._update(job['id'], attempts=job['attempts'] + 1, error=error,
+                         publish_at=time.time() + RETRY_DELAY)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,242 @@
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlparse, urlsplit, urlunsplit
+
+import cache
+import metrics
+
+# SQLite file caching search results (None disables the cache)
+SEARCH_CACHE_PATH = 'search_cache.db'
+
+# Size limit of the search cache, in bytes of stored results
+SEARCH_CACHE_BYTES = 5 * 1024 * 1024
+
+# Seconds before cached results for a query are searched again
+SEARCH_TTL = 60 * 60
+
+# Recency filter passed to providers: 'day', 'week', 'month' or None for any time
+FRESHNESS = 'day'
+
+# Seconds to wait for a provider's response
+TIMEOUT = 10
+
+# Query variants searched side by side for each topic
+MAX_VARIANTS = 3
+
+# Reciprocal rank fusion constant: higher values flatten the rank weighting
+RRF_K = 60
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+class SearchProvider(ABC):
+    """
+    Base class for web search back ends.
+
+    Subclasses implement `search`, returning result URLs best first. A
+    provider should raise (or return an empty list) when the search fails;
+    it must not retry on its own.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def search(self, query, num_results=10, freshness=None):
+        """
+        Returns up to `num_results` result URLs for `query`, best first.
+        """
+
+class GoogleScrapeProvider(SearchProvider):
+    """
+    Scrapes the plain HTML result page of google.com.
+
+    Scraping is against Google's terms and gets blocked easily, so this is
+    only a last resort when no search API is configured.
+    """
+
+    name = 'google'
+    URL = 'https://www.google.com/search'
+    FRESHNESS = {'day': 'qdr:d', 'week': 'qdr:w', 'month': 'qdr:m'}
+
+    def __init__(self, session=None):
+        self.session = session
+
+    def search(self, query, num_results=10, freshness=None):
+        # Shares research's session and per-host politeness delay
+        import research
+        from lxml import html as lxml_html
+
+        params = {'q': query, 'num': num_results, 'hl': 'en'}
+        if freshness in self.FRESHNESS:
+            params['tbs'] = self.FRESHNESS[freshness]
+        url = f'{self.URL}?{urlencode(params)}'
+
+        research.wait_for_host(url)
+        response = (self.session or research.get_session()).get(url, timeout=TIMEOUT)
+        if response.status_code != 200:
+            raise RuntimeError(f"Google returned {response.status_code}")
+
+        links = []
+        for href in lxml_html.fromstring(response.content).xpath('//a/@href'):
+            if href.startswith('/url?'):
+                # Result links are redirects: /url?q=<target>&sa=...
+                href = parse_qs(urlparse(href).query).get('q', [''])[0]
+            if href.startswith('http') and 'google.' not in urlparse(href).netloc and href not in links:
+                links.append(href)
+                if len(links) >= num_results:
+                    break
+        return links
+
+class JsonApiProvider(SearchProvider):
+    """
+    Queries a JSON search endpoint, such as a self-hosted SearxNG instance
+    or a local stand-in server.
+
+    The endpoint is called as `<base_url>?q=<query>&format=json` and may
+    answer with {"results": [{"url": ...}, ...]} or a plain list of URLs.
+    """
+
+    name = 'json'
+    FRESHNESS = {'day': 'day', 'week': 'week', 'month': 'month'}
+
+    def __init__(self, base_url, session=None):
+        self.base_url = base_url
+        self.session = session
+
+    def search(self, query, num_results=10, freshness=None):
+        import research
+
+        params = {'q': query, 'format': 'json'}
+        if freshness in self.FRESHNESS:
+            params['time_range'] = self.FRESHNESS[freshness]
+        response = (self.session or research.get_session()).get(self.base_url, params=params, timeout=TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        results = data.get('results', []) if isinstance(data, dict) else data
+        urls = [r['url'] if isinstance(r, dict) else r for r in results]
+        return urls[:num_results]
+
+class StaticProvider(SearchProvider):
+    """
+    Offline provider answering from a dictionary of query -> URLs (or a
+    function of the query). Useful for tests and benchmarks.
+    """
+
+    name = 'static'
+
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, query, num_results=10, freshness=None):
+        urls = self.results(query) if callable(self.results) else self.results.get(query, [])
+        return list(urls)[:num_results]
+
+def get_search_cache():
+    """
+    Returns the shared on-disk search cache, or None if SEARCH_CACHE_PATH is unset.
+    """
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None and SEARCH_CACHE_PATH:
+            _search_cache = cache.DiskCache(SEARCH_CACHE_PATH, SEARCH_CACHE_BYTES)
+        return _search_cache
+
+def query_variants(topic, max_variants=MAX_VARIANTS):
+    """
+    Returns differently phrased queries for `topic`, the plain topic first.
+    """
+    topic = ' '.join(topic.split())
+    variants = [topic, f'{topic} news', f'"{topic}" latest']
+    return variants[:max_variants]
+
+def normalize_url(url):
+    """
+    Drops the fragment and a trailing slash so the same page ranks as one result.
+    """
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path.rstrip('/') or '/', parts.query, ''))
+
+class SearchClient:
+    """
+    Cached, multi-query search on top of a provider.
+
+    Each topic is searched with several query variants at once. Results of
+    each query are cached per provider, query and freshness for SEARCH_TTL
+    seconds; when a fresh search fails, older cached results are used
+    instead. The ranked lists are merged with reciprocal rank fusion, so
+    URLs that several variants agree on come first.
+
+    Args:
+        provider (SearchProvider): Search back end.
+        use_cache (bool): Use the shared on-disk search cache.
+        freshness (str): Recency filter passed to the provider.
+    """
+
+    def __init__(self, provider, use_cache=True, freshness=FRESHNESS):
+        self.provider = provider
+        self.use_cache = use_cache
+        self.freshness = freshness
+
+    def _query(self, query, num_results):
+        store = get_search_cache() if self.use_cache else None
+        key = f'{self.provider.name}:{self.freshness}:{num_results}:{query}'
+        entry = store.get(key, max_age=SEARCH_TTL) if store else None
+        if store:
+            metrics.incr('cache_hits' if entry and entry['fresh'] else 'cache_misses', cache='search')
+        if entry and entry['fresh']:
+            return entry['value']
+
+        try:
+            with metrics.timed('search'):
+                urls = self.provider.search(query, num_results, self.freshness)
+        except Exception as e:
+            print(f"Search for '{query}' failed: {e}")
+            urls = []
+
+        if urls and store:
+            store.set(key, urls)
+        elif not urls and entry:
+            print(f"Using older cached results for '{query}'.")
+            return entry['value']
+        return urls
+
+    def search(self, topic, num_results=3, variants=MAX_VARIANTS):
+        """
+        Returns up to `num_results` URLs for `topic`, best first.
+        """
+        queries = query_variants(topic, variants)
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            rankings = list(pool.map(lambda q: self._query(q, num_results * 2), queries))
+
+        scores = {}
+        first_seen = {}
+        for ranking in rankings:
+            for rank, url in enumerate(ranking):
+                key = normalize_url(url)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                first_seen.setdefault(key, url)
+        best = sorted(scores, key=lambda key: -scores[key])
+        return [first_seen[key] for key in best[:num_results]]
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Returns the shared search client, scraping Google unless another provider was set.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SearchClient(GoogleScrapeProvider())
+        return _client
+
+def set_provider(provider, **options):
+    """
+    Replaces the shared client with one using `provider` (e.g. a JsonApiProvider).
+    """
+    global _client
+    with _client_lock:
+        _client = SearchClient(provider, **options)
+        return _client
@@ -1,34 +1,990 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 import trends
 import research
 import writer
 import publisher
+import pipeline
+import extractor
+import cache
+import topic_index
+import context
+import ratelimit
+import scheduler
+import main
+import metrics
+import token_store
+import artifacts
+import postprocess
+import search
+import trend_history
 
 class TestAutoPoster(unittest.TestCase):
 
+    def setUp(self):
+        trends.clear_cache()
+        metrics.get_registry().reset()
+        article_cache = patch('research._article_cache', cache.DiskCache(':memory:'))
+        article_cache.start()
+        self.addCleanup(article_cache.stop)
+        generation_cache = patch('writer._generation_cache', cache.DiskCache(':memory:'))
+        generation_cache.start()
+        self.addCleanup(generation_cache.stop)
+        search_cache = patch('search._search_cache', cache.DiskCache(':memory:'))
+        search_cache.start()
+        self.addCleanup(search_cache.stop)
+        artifact_store = patch('artifacts._store', artifacts.ArtifactStore(':memory:'))
+        artifact_store.start()
+        self.addCleanup(artifact_store.stop)
+        history = patch('trend_history._history', trend_history.TrendHistory(':memory:'))
+        history.start()
+        self.addCleanup(history.stop)
+
+    FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss xmlns:ht="https://trends.google.com/trending/rss" version="2.0"><channel>
+  <item>
+    <title>Test Trend</title>
+    <ht:approx_traffic>20K+</ht:approx_traffic>
+    <link>http://test.com</link>
+    <ht:news_item>
+      <ht:news_item_title>First &amp; best</ht:news_item_title>
+      <ht:news_item_url>http://news.com/1</ht:news_item_url>
+      <ht:news_item_source>News</ht:news_item_source>
+    </ht:news_item>
+    <ht:news_item>
+      <ht:news_item_title>Second</ht:news_item_title>
+      <ht:news_item_url>http://news.com/2</ht:news_item_url>
+    </ht:news_item>
+  </item>
+  <item><title>Other</title><ht:approx_traffic>1,000+</ht:approx_traffic></item>
+</channel></rss>"""
+
     def test_trends_fetching(self):
-        # Mock feedparser
-        with patch('trends.feedparser.parse') as mock_parse:
-            mock_entry = MagicMock()
-            mock_entry.title = "Test Trend"
-            mock_entry.link = "http://test.com"
-            mock_entry.ht_news_item = [{'ht_news_item_title': 'News', 'ht_news_item_url': 'http://news.com'}]
+        with patch('trends.get_session') as mock_session:
+            response = mock_session.return_value.get.return_value
+            response.status_code = 200
+            response.content = self.FEED
+
+            topics = trends.get_trending_topics('GB')
+
+        self.assertEqual(len(topics), 2)
+        self.assertEqual(topics[0]['title'], "Test Trend")
+        self.assertEqual((topics[0].traffic, topics[1]['traffic']), (20000, 1000))
+        self.assertEqual(topics[0]['geo'], 'GB')
+        self.assertEqual([(n['title'], n.get('source')) for n in topics[0]['news_items']],
+                         [("First & best", "News"), ("Second", None)])
+        self.assertEqual(dict(topics[1])['news_items'], [])
+        self.assertEqual(trends.parse_traffic("1.5M+"), 1500000)
+
+    def test_trends_cache_and_conditional_get(self):
+        with patch('trends.get_session') as mock_session:
+            response = mock_session.return_value.get.return_value
+            response.status_code = 200
+            response.content = self.FEED
+            response.headers = {'ETag': 'abc'}
+            get = mock_session.return_value.get
 
-            mock_parse.return_value.entries = [mock_entry]
+            trends.get_trending_topics()
+            trends.get_trending_topics()
+            self.assertEqual(get.call_count, 1)
 
-            topics = trends.get_trending_topics()
-            self.assertEqual(len(topics), 1)
+            response.status_code = 304
+            topics = trends.get_trending_topics(max_age=0)
+            self.assertEqual(get.call_count, 2)
+            self.assertEqual(get.call_args.kwargs['headers'], {'If-None-Match': 'abc'})
             self.assertEqual(topics[0]['title'], "Test Trend")
 
+    def test_trends_multi_geo_merge(self):
+        feeds = {
+            'US': [trends.Topic('Shared', traffic=200, news_items=[trends.NewsItem(url='http://a')]),
+                   trends.Topic('US only')],
+            'GB': [trends.Topic('shared', traffic=100,
+                                news_items=[trends.NewsItem(url='http://a'), trends.NewsItem(url='http://b')])],
+        }
+        with patch('trends.get_trending_topics', side_effect=lambda geo, max_age: feeds[geo]):
+            merged = trends.get_trending_topics_multi(['US', 'GB'])
+
+        self.assertEqual([t['title'] for t in merged], ['Shared', 'US only'])
+        self.assertEqual(merged[0]['geos'], ['US', 'GB'])
+        self.assertEqual(merged[0]['traffic'], 300)
+        self.assertIsNone(feeds['US'][0].geos)
+        self.assertEqual([n['url'] for n in merged[0]['news_items']], ['http://a', 'http://b'])
+
     def test_research_scraping(self):
-        with patch('research.requests.get') as mock_get:
-            mock_get.return_value.status_code = 200
-            mock_get.return_value.text = "<html><body><p>Test content.</p></body></html>"
+        with patch('research.get_session') as mock_session:
+            response = mock_session.return_value.get.return_value.__enter__.return_value
+            response.status_code = 200
+            response.headers = {'Content-Type': 'text/html; charset=utf-8'}
+            response.iter_content.return_value = [b"<html><body><p>Test content.</p></body></html>"]
 
             text = research.extract_text_from_url("http://test.com")
             self.assertIn("Test content", text)
 
+    def test_research_skips_non_html(self):
+        with patch('research.get_session') as mock_session:
+            response = mock_session.return_value.get.return_value.__enter__.return_value
+            response.status_code = 200
+            response.headers = {'Content-Type': 'application/pdf'}
+
+            self.assertEqual(research.download("http://test.com/file.pdf")['page'], "")
+            response.iter_content.assert_not_called()
+
+    def test_research_caps_bytes_read(self):
+        response = MagicMock()
+        chunks = iter([b"a" * 100] * 50)
+        response.iter_content.return_value = chunks
+        text = research.read_capped(response, 'text/html', max_bytes=250)
+        self.assertEqual(len(text), 250)
+        # Stops pulling chunks once the cap is reached
+        self.assertEqual(len(list(chunks)), 47)
+
+        response.iter_content.return_value = ["caf\u00e9".encode('latin-1')]
+        self.assertEqual(research.read_capped(response, 'text/html; charset=ISO-8859-1'), "caf\u00e9")
+
+    def test_extractor_picks_article_block(self):
+        paragraph = "<p>" + "Real article sentence with facts. " * 5 + "</p>"
+        page = (
+            "<html><head><script>var x = 1;</script></head><body>"
+            "<div id='menu'><a href='/a'>Home</a> <a href='/b'>World news and more links</a></div>"
+            "<article><h1>Headline</h1>" + paragraph * 4 + "</article>"
+            "<footer>Copyright footer text</footer></body></html>"
+        )
+        text = extractor.extract_main_text(page)
+        self.assertTrue(text.startswith("Headline"))
+        self.assertIn("Real article sentence", text)
+        self.assertNotIn("World news", text)
+        self.assertNotIn("Copyright", text)
+        self.assertNotIn("var x", text)
+
+        self.assertLessEqual(len(extractor.extract_main_text(page, max_chars=50)), 50)
+
+    def test_article_cache_revalidates(self):
+        page = {'status': 200, 'page': "<p>Cached story text.</p>", 'etag': '"v1"', 'last_modified': None}
+        with patch('research.download', return_value=page) as mock_download:
+            self.assertIn("Cached story", research.extract_text_from_url("http://news.com/a"))
+            self.assertIn("Cached story", research.extract_text_from_url("http://news.com/a"))
+            self.assertEqual(mock_download.call_count, 1)
+
+            mock_download.return_value = {'status': 304, 'page': "", 'etag': None, 'last_modified': None}
+            with patch('research.ARTICLE_TTL', 0):
+                self.assertIn("Cached story", research.extract_text_from_url("http://news.com/a"))
+                # A failed revalidation falls back to the stale text
+                mock_download.return_value = {'status': 503, 'page': "", 'etag': None, 'last_modified': None}
+                self.assertIn("Cached story", research.extract_text_from_url("http://news.com/a"))
+            self.assertEqual(mock_download.call_args.kwargs['etag'], '"v1"')
+
+        stats = research.get_article_cache().stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['revalidated'], 1)
+
+    def test_disk_cache_evicts_least_recently_used(self):
+        store = cache.DiskCache(':memory:', max_bytes=50)
+        store.set('old', "x" * 20)
+        store.set('new', "y" * 20)
+        store.get('old')
+        store.set('newest', "z" * 20)
+
+        self.assertIsNotNone(store.get('old'))
+        self.assertIsNone(store.get('new'))
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_context_dedupes_and_ranks(self):
+        # Each paragraph is long enough to form its own passage
+        shared = "The mayor announced the new bridge will open to traffic next spring after years of delays. " * 6
+        relevant = "Engineers said the bridge design uses a cable stayed span across the river channel today. " * 6
+        filler = "Subscribe to our newsletter for daily updates on sports, weather and local events now. " * 6
+        sources = [
+            ("http://a.com", f"{shared}\n{filler}"),
+            ("http://b.com", f"{shared}\n{relevant}"),
+        ]
+        text = context.assemble_context("bridge", sources)
+        self.assertEqual(text.count(shared.strip()), 1)
+        self.assertIn("cable stayed", text)
+
+        header = context.estimate_tokens("Research for Topic: bridge\n\n")
+        source = context.estimate_tokens("--- Source: http://a.com ---\n")
+        tight = context.assemble_context("bridge", sources, token_budget=header + source + context.estimate_tokens(shared.strip()))
+        self.assertIn("The mayor announced", tight)
+        self.assertNotIn("Subscribe", tight)
+        self.assertNotIn("cable stayed", tight)
+
+    def test_research_fetches_concurrently(self):
+        urls = [f"http://host{i}.com/a" for i in range(4)]
+
+        def slow_extract(url, parse_processes=0, stop=None):
+            time.sleep(0.2)
+            return f"text from {url} " * 20
+
+        with patch('research.extract_text_from_url', side_effect=slow_extract):
+            start = time.monotonic()
+            sources = research.fetch_first(urls, wanted=4, hedge=0)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(sources, [(u, f"text from {u} " * 20) for u in urls])
+        self.assertLess(elapsed, 0.6)
+
+    def test_research_ranks_sources_by_relevance(self):
+        items = [
+            {'url': "http://a.com/1", 'title': "Weather this weekend", 'source': "A"},
+            {'url': "http://b.com/1", 'title': "Eclipse path crosses Texas", 'source': "B"},
+            {'url': "http://b.com/2", 'title': "Solar eclipse in Texas today", 'source': "B"},
+            {'url': "http://c.com/1", 'title': "Solar eclipse guide", 'source': "Solar News"},
+        ]
+        self.assertEqual(research.rank_sources("solar eclipse texas", items),
+                         ["http://b.com/2", "http://c.com/1", "http://a.com/1", "http://b.com/1"])
+
+    def test_research_stops_at_first_good_sources(self):
+        urls = [f"http://host{i}.com/a" for i in range(6)]
+        stops = []
+
+        def extract(url, parse_processes=0, stop=None):
+            if url.startswith("http://host0"):
+                stops.append(stop)
+                stop.wait(2)
+                return ""
+            if url.startswith("http://host1"):
+                return "too short"
+            if url.startswith("http://host5"):
+                # The replacement for the short source finishes after hosts 2-4
+                time.sleep(0.3)
+            return f"text from {url} " * 20
+
+        with patch('research.extract_text_from_url', side_effect=extract):
+            start = time.monotonic()
+            sources = research.fetch_first(urls, wanted=3, hedge=2)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual([url for url, _ in sources], urls[2:5])
+        self.assertLess(elapsed, 1.0)
+        self.assertTrue(stops[0].is_set())
+        self.assertGreaterEqual(metrics.get_registry().counter('fetches_abandoned'), 1)
+
+    def test_batch_runs_parse_pages_in_processes(self):
+        page = "<html><body><article>" + "<p>The council approved the new bridge design today.</p>" * 8 + "</article></body></html>"
+        response = {'status': 200, 'page': page, 'etag': None, 'last_modified': None}
+        original = research.extract_text_from_url
+        seen = []
+
+        def extract(url, parse_processes=0, stop=None):
+            seen.append(parse_processes)
+            return original(url, parse_processes, stop)
+
+        with patch('research.download', return_value=response), \
+             patch('research.extract_text_from_url', side_effect=extract):
+            with main.parse_processes(1):
+                sources = research.fetch_first(["http://a.com/1"], wanted=1, hedge=0)
+                self.assertIsNotNone(extractor._pool)
+            research.fetch_first(["http://b.com/1"], wanted=1, hedge=0)
+
+        self.assertEqual(seen, [1, 0])
+        self.assertIn("bridge design", sources[0][1])
+        # The pool is stopped once the batch run is over
+        self.assertIsNone(extractor._pool)
+        self.assertEqual(research.PARSE_PROCESSES, 0)
+
+    def test_downloads_share_one_limit(self):
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def get(url, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return MagicMock(status_code=404)
+
+        session = MagicMock()
+        session.get.side_effect = get
+        urls = [f"http://host{i}.com/a" for i in range(8)]
+        with patch('research.MAX_WORKERS', 2), patch('research._download_slots', None), \
+             patch('research.wait_for_host'), patch('research.get_session', return_value=session):
+            # Several fetch_first calls at once, as in batch and backfill runs
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(lambda half: research.fetch_first(half, wanted=4, hedge=0), [urls[:4], urls[4:]]))
+
+        self.assertEqual(session.get.call_count, 8)
+        self.assertEqual(peak[0], 2)
+
+    def test_host_delay_is_per_host(self):
+        with patch('research.HOST_DELAY', (0.3, 0.3)), patch.dict('research._host_next', clear=True):
+            start = time.monotonic()
+            research.wait_for_host("http://a.com/1")
+            research.wait_for_host("http://b.com/1")
+            self.assertLess(time.monotonic() - start, 0.1)
+            research.wait_for_host("http://a.com/2")
+            self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_blogger_client_reuses_service(self):
+        creds = MagicMock(expiry=None)
+        with patch('publisher.get_credentials', return_value=creds) as mock_creds, \
+             patch('publisher.build') as mock_build:
+            client = publisher.BloggerClient(blog_id='123')
+            self.assertTrue(client.publish("A", "<p>a</p>"))
+            self.assertTrue(client.publish("B", "<p>b</p>"))
+
+            mock_creds.assert_called_once()
+            mock_build.assert_called_once()
+            insert = mock_build.return_value.posts.return_value.insert
+            self.assertEqual(insert.call_count, 2)
+
+    def test_blogger_client_refreshes_before_expiry(self):
+        creds = MagicMock(refresh_token='r')
+        creds.expiry = datetime.utcnow() + timedelta(minutes=1)
+        fresh = MagicMock(refresh_token='r', expiry=datetime.utcnow() + timedelta(hours=1))
+        with patch('publisher.get_credentials', side_effect=[creds, fresh]) as mock_creds, \
+             patch('publisher.build') as mock_build:
+            client = publisher.BloggerClient()
+            client.service()
+            self.assertIs(client.service(), mock_build.return_value)
+            self.assertIs(client.credentials(), fresh)
+
+            self.assertEqual(mock_creds.call_count, 2)
+            self.assertEqual(mock_build.call_count, 2)
+
+    def test_token_store_refreshes_once_across_threads(self):
+        def refresh(creds):
+            time.sleep(0.05)
+            creds.expiry = datetime.utcnow() + timedelta(hours=1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'token.pickle')
+            first = token_store.TokenStore(path, refresh=MagicMock(side_effect=refresh))
+            first.save(SimpleNamespace(valid=False, refresh_token='r',
+                                       expiry=datetime.utcnow() - timedelta(minutes=1)))
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda _: first.get(), range(8)))
+            self.assertEqual(first._refresh.call_count, 1)
+            self.assertTrue(all(creds is results[0] for creds in results))
+
+            # A second store (as in another process) picks up the saved token without refreshing
+            second = token_store.TokenStore(path, refresh=MagicMock())
+            self.assertGreater(second.get().expiry, datetime.utcnow() + timedelta(minutes=30))
+            second._refresh.assert_not_called()
+            self.assertEqual(sorted(os.listdir(tmp)), ['token.pickle', 'token.pickle.lock'])
+
+    def test_publish_queue_batches_and_reports(self):
+        class FakeBatch:
+            def __init__(self, callback):
+                self.callback = callback
+                self.requests = []
+
+            def add(self, request, request_id):
+                self.requests.append(request_id)
+
+            def execute(self):
+                for rid in self.requests:
+                    if rid == 'bad':
+                        self.callback(rid, None, Exception("quota"))
+                    else:
+                        self.callback(rid, {'url': f"http://blog/{rid}"}, None)
+
+        batches = []
+        service = MagicMock()
+        service.new_batch_http_request.side_effect = lambda callback: batches.append(FakeBatch(callback)) or batches[-1]
+        client = MagicMock()
+        client.service.return_value = service
+        client.blog_id.return_value = '123'
+
+        queue = publisher.PublishQueue(client=client, batch_size=2)
+        queue.add("One", "<p>1</p>", key='a')
+        queue.add("Two", "<p>2</p>", key='bad')
+        queue.add("Three", "<p>3</p>", key='c')
+        results = queue.flush()
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual([r['key'] for r in results], ['a', 'bad', 'c'])
+        self.assertEqual([r['success'] for r in results], [True, False, True])
+        self.assertEqual(results[2]['url'], "http://blog/c")
+        self.assertEqual(len(queue), 0)
+
+        # Generated keys never clash with caller-supplied ones
+        queue.add("Zero", "<p>0</p>", key='0')
+        self.assertNotEqual(queue.add("Auto", "<p>a</p>"), '0')
+        with self.assertRaises(ValueError):
+            queue.add("Again", "<p>0</p>", key='0')
+
+    def test_pipeline_overlaps_stages(self):
+        def slow(item):
+            time.sleep(0.1)
+            return item
+
+        engine = pipeline.Pipeline([
+            pipeline.Stage('a', slow),
+            pipeline.Stage('b', slow),
+        ], queue_size=1)
+        start = time.monotonic()
+        results = engine.run(range(4))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(results, [0, 1, 2, 3])
+        # Sequential would take 0.8s; pipelined is bounded by the slowest stage
+        self.assertLess(elapsed, 0.7)
+
+    def test_pipeline_drops_failed_items(self):
+        def check(item):
+            if item == 2:
+                raise ValueError("bad item")
+            return None if item == 3 else item * 10
+
+        engine = pipeline.Pipeline([pipeline.Stage('check', check, workers=3)])
+        self.assertEqual(sorted(engine.run(range(5))), [0, 10, 40])
+
+    def test_topic_index_detects_rewordings(self):
+        index = topic_index.PublishedIndex(':memory:')
+        index.add("Lakers vs Celtics", title="Lakers stun Celtics", content="<p>Game recap</p>")
+
+        match = index.find_duplicate("Celtics vs. Lakers")
+        self.assertIsNotNone(match)
+        self.assertEqual(match['title'], "Lakers stun Celtics")
+        self.assertIsNone(index.find_duplicate("Bitcoin price today"))
+
+        # Titles made only of stopwords still get distinct fingerprints
+        index.add("The Who")
+        self.assertIsNotNone(index.find_duplicate("the who"))
+        self.assertIsNone(index.find_duplicate("What's new"))
+
+        # Recurring trends can be covered again once the lookback window has passed
+        later = time.time() + topic_index.LOOKBACK + 60
+        with patch('topic_index.time.time', return_value=later):
+            self.assertIsNone(index.find_duplicate("Lakers vs Celtics"))
+        self.assertIsNotNone(index.find_duplicate("Lakers vs Celtics", lookback=None))
+
+    def test_topic_index_persists(self):
+        path = os.path.join(tempfile.mkdtemp(), 'index.db')
+        index = topic_index.PublishedIndex(path)
+        index.add("Taylor Swift new album")
+        index.close()
+
+        reopened = topic_index.PublishedIndex(path)
+        self.assertEqual(len(reopened), 1)
+        self.assertIsNotNone(reopened.find_duplicate("Taylor Swift's new albums"))
+
+    def test_trend_history_ranks_rising_topics(self):
+        history = trend_history._history
+        start = 1_000_000
+        history.record('US', [{'title': "Steady", 'traffic': 50000}, {'title': "Rising", 'traffic': 5000},
+                              {'title': "Posted", 'traffic': 1000}], at=start)
+        history.record('US', [{'title': "Steady", 'traffic': 50000}, {'title': "Rising", 'traffic': 5000},
+                              {'title': "Posted", 'traffic': 1000}], at=start + 60)
+        current = [{'title': "Steady", 'traffic': 50000}, {'title': "Rising", 'traffic': 100000},
+                   {'title': "Posted", 'traffic': 200000}, {'title': "New", 'traffic': 2000}]
+        history.record('US', current, at=start + 3 * 3600)
+
+        # The unchanged poll a minute later adds no snapshot
+        self.assertEqual(history.history('US', "steady"), [(start, 50000, 0), (start + 3 * 3600, 50000, 0)])
+        self.assertEqual(len(history.history('US', "Rising")), 2)
+
+        index = topic_index.PublishedIndex(':memory:')
+        index.add("Posted")
+        ranked = trend_history.rank_topics(current, 'US', index=index, now=start + 3 * 3600)
+        self.assertEqual([t['title'] for t in ranked], ["Rising", "New", "Steady"])
+
+        # A topic merged from several geos is compared with the sum of their baselines
+        history.record('US', [{'title': "Local", 'traffic': 20000}, {'title': "Global", 'traffic': 10000}], at=start)
+        history.record('GB', [{'title': "Global", 'traffic': 10000}], at=start)
+        merged = [trends.Topic("Local", traffic=20000, geo='US'),
+                  trends.Topic("Global", traffic=20000, geo='US', geos=['US', 'GB'])]
+        local, shared = history.score(merged, now=start + 3 * 3600)
+        self.assertAlmostEqual(local, shared)
+
+    def test_trends_polls_feed_history_and_choose_topic(self):
+        with patch('trends.get_session') as mock_session:
+            response = mock_session.return_value.get.return_value
+            response.status_code = 200
+            response.content = self.FEED
+            response.headers = {}
+            trends.get_trending_topics('GB')
+        self.assertEqual(trend_history._history.history('GB', "Test Trend")[0][1:], (20000, 0))
+
+        trend_history._history.record('US', [{'title': "Old news", 'traffic': 500000},
+                                             {'title': "Breaking", 'traffic': 1000}], at=time.time() - 3 * 3600)
+        feed = [trends.Topic("Old news", traffic=500000), trends.Topic("Breaking", traffic=200000)]
+        with patch('trends.get_trending_topics', return_value=feed), \
+             patch('main.topic_index.get_index', return_value=topic_index.PublishedIndex(':memory:')):
+            self.assertEqual(main.choose_topic()['title'], "Breaking")
+            self.assertEqual(main.choose_topic(exclude={"Breaking"})['title'], "Old news")
+
+    def test_writer_caches_generations(self):
+        with patch('writer.get_model') as mock_model, patch.dict('writer._clients', clear=True):
+            mock_model.return_value.generate_content.return_value.text = "TITLE: Hello\nCONTENT:\n```html<p>Body</p>```"
+
+            first = writer.write_blog_post("Topic", "Context")
+            second = writer.write_blog_post("Topic", "Context")
+            self.assertEqual(first, ("Hello", "<p>Body</p>"))
+            self.assertEqual(second, first)
+            self.assertEqual(mock_model.return_value.generate_content.call_count, 1)
+
+            writer.write_blog_post("Topic", "Different context")
+            self.assertEqual(mock_model.return_value.generate_content.call_count, 2)
+
+    def test_writer_reuses_model(self):
+        with patch('writer.genai.GenerativeModel') as mock_cls, patch.dict('writer._models', clear=True):
+            self.assertIs(writer.get_model(), writer.get_model())
+            mock_cls.assert_called_once_with(writer.MODEL_NAME)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = ratelimit.TokenBucket(10, per=1.0)
+        start = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        # 10 burst tokens, then 5 more at 10/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+        self.assertFalse(bucket.acquire(5, timeout=0.05))
+
+    def test_gemini_client_retries_quota_errors(self):
+        from google.api_core import exceptions as google_exceptions
+        with patch('writer.get_model') as mock_model, patch('writer.BACKOFF_BASE', 0.01):
+            reply = MagicMock(text="TITLE: T\nCONTENT:\n<p>x</p>")
+            mock_model.return_value.generate_content.side_effect = [
+                google_exceptions.ResourceExhausted("quota"),
+                google_exceptions.ServiceUnavailable("busy"),
+                reply,
+            ]
+            client = writer.GeminiClient(rpm=600, tpm=10 ** 6)
+            self.assertEqual(client.generate("prompt"), reply.text)
+            self.assertEqual(mock_model.return_value.generate_content.call_count, 3)
+
+            mock_model.return_value.generate_content.side_effect = ValueError("bad request")
+            with self.assertRaises(ValueError):
+                client.generate("prompt")
+
+    def test_writer_generates_concurrently_under_shared_limit(self):
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def generate_content(prompt):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return MagicMock(text="TITLE: T\nCONTENT:\n<p>x</p>")
+
+        client = writer.GeminiClient(tpm=10 ** 6)
+        # 4 requests at once, then 4 more per second
+        client.requests = ratelimit.TokenBucket(4, per=1.0)
+        jobs = [("Topic", f"Context {i}") for i in range(6)]
+        with patch('writer.get_model') as mock_model, patch.dict('writer._clients', {writer.MODEL_NAME: client}):
+            mock_model.return_value.generate_content.side_effect = generate_content
+            start = time.monotonic()
+            results = writer.write_many(jobs, max_workers=6)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(results, [("T", "<p>x</p>")] * 6)
+        self.assertGreater(peak[0], 1)
+        self.assertLessEqual(peak[0], 4)
+        self.assertGreaterEqual(elapsed, 0.45)
+
+    def test_scheduler_spreads_and_prepares_ahead(self):
+        sched = scheduler.Scheduler(':memory:', lead_time=0.2)
+        start = time.time() + 0.1
+        sched.plan(3, 0.6, start=start)
+        slots = [job['publish_at'] for job in sched.jobs()]
+        self.assertEqual([round(s - start, 2) for s in slots], [0.0, 0.2, 0.4])
+
+        prepared, published = {}, {}
+
+        def prepare(job):
+            prepared[job['id']] = time.time()
+            return {'title': f"Post {job['id']}", 'content': "<p>x</p>", 'labels': ["News"]}
+
+        def publish(job):
+            published[job['id']] = time.time()
+            return job['labels'] == ["News"]
+
+        sched.run(prepare, publish)
+        for job in sched.jobs((scheduler.PUBLISHED,)):
+            self.assertLess(prepared[job['id']], job['publish_at'])
+            self.assertGreaterEqual(published[job['id']], job['publish_at'])
+        self.assertEqual(len(published), 3)
+
+    def test_scheduler_resumes_after_restart(self):
+        path = os.path.join(tempfile.mkdtemp(), 'schedule.db')
+        sched = scheduler.Scheduler(path)
+        ready, crashed = sched.plan(2, 0, start=time.time())
+        sched._update(ready, state=scheduler.READY, title="Saved", content="<p>saved</p>")
+        sched._update(crashed, state=scheduler.PREPARING)
+        sched.close()
+
+        sched = scheduler.Scheduler(path, lead_time=0)
+        states = {job['id']: job['state'] for job in sched.jobs()}
+        self.assertEqual(states, {ready: scheduler.READY, crashed: scheduler.SCHEDULED})
+
+        prepare = MagicMock(return_value={'title': "New", 'content': "<p>new</p>"})
+        publish = MagicMock(return_value=True)
+        sched.run(prepare, publish)
+        # The saved post is published without being prepared again
+        self.assertEqual([c.args[0]['id'] for c in prepare.call_args_list], [crashed])
+        self.assertEqual(publish.call_count, 2)
+
+        # Slots missed while stopped keep their gaps instead of firing at once
+        now = time.time()
+        missed = sched.plan(3, 3600, start=now - 3 * 3600)
+        self.assertAlmostEqual(sched.respace_overdue(now=now), 3 * 3600)
+        slots = {job['id']: job['publish_at'] - now for job in sched.jobs()}
+        self.assertEqual([round(slots[i]) for i in missed], [0, 1200, 2400])
+        self.assertEqual(sched.respace_overdue(now=now), 0)
+
+    def test_scheduler_retries_slot_with_next_topic(self):
+        titles = ["Dead topic", "Good one", "Good two", "Dead again", "Dead still"]
+        prepared = []
+
+        def choose(exclude=(), geo='US'):
+            return next(({'title': title, 'news_items': []} for title in titles if title not in exclude), None)
+
+        def research(job):
+            prepared.append(job['topic']['title'])
+            return None if job['topic']['title'].startswith("Dead") else dict(job, research="notes")
+
+        def write(job):
+            return dict(job, title=job['topic']['title'], content="<p>x</p>")
+
+        sched = scheduler.Scheduler(':memory:', lead_time=0)
+        sched.plan(2, 0, start=time.time())
+        with patch('main.choose_topic', side_effect=choose), patch('main.research_stage', side_effect=research), \
+             patch('main.write_stage', side_effect=write), \
+             patch('main.publish_stage', side_effect=lambda job: dict(job, published=True)), \
+             patch.object(sched, 'close'):
+            jobs = main.run_schedule(sched)
+
+        self.assertEqual([job['state'] for job in jobs], [scheduler.PUBLISHED] * 2)
+        self.assertEqual(sorted(job['title'] for job in jobs), ["Good one", "Good two"])
+        self.assertEqual(prepared.count("Dead topic"), 1)
+
+        # A slot whose topics all fail is skipped after MAX_PREPARE_TRIES
+        prepare = MagicMock(return_value=None)
+        [job_id] = sched.plan(1, 0, start=time.time())
+        sched.run(prepare, MagicMock())
+        self.assertEqual(prepare.call_count, scheduler.MAX_PREPARE_TRIES)
+        self.assertEqual(sched.jobs((scheduler.SKIPPED,))[0]['id'], job_id)
+
+    def test_cli_cancel_schedule(self):
+        path = os.path.join(tempfile.mkdtemp(), 'schedule.db')
+        sched = scheduler.Scheduler(path)
+        done, _, _ = sched.plan(3, 3600)
+        sched._update(done, state=scheduler.PUBLISHED)
+        sched.close()
+
+        queue = scheduler.Scheduler
+        with patch('scheduler.Scheduler', side_effect=lambda: queue(path)), \
+             patch('sys.stdout', new_callable=io.StringIO) as out:
+            self.assertEqual(main.cli(['cancel-schedule']), 0)
+        self.assertIn("Cancelled 2 scheduled posts", out.getvalue())
+
+        sched = queue(path)
+        self.assertEqual(sched.jobs(), [])
+        self.assertEqual(len(sched.jobs(scheduler.DONE_STATES)), 1)
+        sched.close()
+
+    def test_cli_imports_lazily(self):
+        code = "import main, sys; print(','.join(m for m in main.HEAVY_MODULES if m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_cli_startup_budget(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        subprocess.run([sys.executable, script, '--help'], capture_output=True)  # warm the bytecode cache
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, script, '--help'], capture_output=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertLess(time.perf_counter() - start, main.STARTUP_BUDGET)
+
+    def test_cli_list_trends_uses_config(self):
+        path = os.path.join(tempfile.mkdtemp(), 'autopost.json')
+        with open(path, 'w') as f:
+            f.write('{"geo": "GB", "limit": 1}')
+
+        topics = [{'title': 'One', 'traffic': 10}, {'title': 'Two', 'traffic': 5}]
+        with patch('trends.get_trending_topics', return_value=topics) as mock_trends, \
+             patch('sys.stdout', new_callable=io.StringIO) as out:
+            code = main.cli(['--config', path, 'list-trends'])
+
+        self.assertEqual(code, 0)
+        mock_trends.assert_called_once_with('GB')
+        self.assertIn("One", out.getvalue())
+        self.assertNotIn("Two", out.getvalue())
+
+    def test_cli_scheduled_batch_exit_codes(self):
+        config = os.path.join(tempfile.mkdtemp(), 'autopost.json')
+        queue = scheduler.Scheduler
+        with patch('main.configure_from_settings', return_value=True), \
+             patch('scheduler.Scheduler', side_effect=lambda: queue(':memory:')), \
+             patch('sys.stdout', new_callable=io.StringIO) as out:
+            self.assertEqual(main.cli(['--config', config, 'run-batch', '--hours', '2']), 2)
+            self.assertIn("--count is required", out.getvalue())
+
+            with patch('main.run_schedule', return_value=[{'state': scheduler.PUBLISHED}, {'state': scheduler.SKIPPED}]):
+                self.assertEqual(main.cli(['--config', config, 'run-batch', '--hours', '2', '--count', '2']), 1)
+            with patch('main.run_schedule', return_value=[{'state': scheduler.PUBLISHED}]):
+                self.assertEqual(main.cli(['--config', config, 'run-batch', '--hours', '2', '--count', '1']), 0)
+
+            with patch('main.run_batch', return_value=[]):
+                self.assertEqual(main.cli(['--config', config, 'run-batch', '--count', '2']), 1)
+            with patch('main.run_batch', return_value=[{'published': True}]):
+                self.assertEqual(main.cli(['--config', config, 'run-batch', '--count', '2']), 1)
+            with patch('main.run_batch', return_value=[{'published': True}, {'published': True}]):
+                self.assertEqual(main.cli(['--config', config, 'run-batch', '--count', '2']), 0)
+
+    def test_fanout_shares_research_across_blogs(self):
+        import fanout
+
+        blogs, lookups = [], []
+        for name, geo in (('tech', 'US'), ('news', 'US'), ('uk', 'GB')):
+            blog = fanout.Blog(name, blog_id=name, geo=geo, posts=1, requests_per_minute=600, index_file=':memory:')
+            blog.client = MagicMock()
+            blog.client.publish.return_value = True
+            blog.client.blog_id.side_effect = lambda name=name: lookups.append(threading.current_thread()) or name
+            blogs.append(blog)
+
+        calls = []
+        calls_lock = threading.Lock()
+
+        def generate(prompt):
+            with calls_lock:
+                calls.append(prompt)
+                n = len(calls)
+            return f"TITLE: T{n}\nCONTENT:\n<p>body {n}</p>"
+
+        feeds = {'US': [{'title': 'Shared story', 'news_items': []}], 'GB': [{'title': 'UK story', 'news_items': []}]}
+        with patch('fanout.trends.get_trending_topics', side_effect=lambda geo: feeds[geo]) as mock_trends, \
+             patch('fanout.research.research_topic', return_value="context") as mock_research, \
+             patch('writer.get_client') as mock_client:
+            mock_client.return_value.generate.side_effect = generate
+            results = fanout.FanOut(blogs, workers=3).run()
+
+        self.assertEqual(mock_trends.call_count, 2)
+        self.assertEqual(mock_research.call_count, 2)
+        # Blogs sharing a topic still get their own generation, not another blog's cached post
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all(r['published'] for r in results))
+        titles = set()
+        for blog in blogs:
+            blog.client.publish.assert_called_once()
+            titles.add(blog.client.publish.call_args.args[:2])
+            self.assertEqual(len(blog.index), 1)
+        self.assertEqual(len(titles), 3)
+        # Blog ids (which may prompt) are looked up before the worker pool starts
+        self.assertEqual(lookups, [threading.current_thread()] * 3)
+
+    def test_metrics_export_formats(self):
+        with metrics.timed('fetch'):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.timed('fetch'):
+                raise ValueError("boom")
+        metrics.incr('cache_hits', cache='article')
+
+        text = metrics.get_registry().to_prometheus()
+        self.assertIn('autopost_stage_seconds_count{stage="fetch"} 2', text)
+        self.assertIn('autopost_stage_seconds_bucket{stage="fetch",le="+Inf"} 2', text)
+        self.assertIn('autopost_errors_total{stage="fetch"} 1', text)
+        self.assertIn('autopost_cache_hits_total{cache="article"} 1', text)
+
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.jsonl')
+        metrics.export(path)
+        metrics.export(path)
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['stages']['fetch']['count'], 2)
+
+    def test_post_cycle_records_trace(self):
+        with patch('research.research_topic', return_value="Research context"), \
+             patch('writer.generate_post', return_value={'title': "Title", 'content': "<p>Body</p>"}), \
+             patch('publisher.publish_post', return_value=True), \
+             patch('main.topic_index.get_index', return_value=topic_index.PublishedIndex(':memory:')):
+            job = main.run_post_cycle({'title': 'Traced topic', 'news_items': []})
+
+        self.assertTrue(job['published'])
+        trace = metrics.get_registry().traces[-1].to_dict()
+        self.assertEqual(trace['name'], 'Traced topic')
+        self.assertEqual([s['stage'] for s in trace['spans']], ['research', 'write', 'publish_cycle'])
+
+    def test_failed_publish_is_retried_from_checkpoint(self):
+        topic = {'title': 'Checkpointed topic', 'news_items': []}
+        with patch('research.research_topic', return_value="Research context") as mock_research, \
+             patch('writer.generate_post', return_value={'title': "Title", 'content': "<p>Body</p>", 'labels': ["Checkpointed topic"]}) as mock_write, \
+             patch('publisher.publish_post', return_value=False) as mock_publish, \
+             patch('publisher.publish_posts', side_effect=lambda posts: [{'success': True} for _ in posts]) as mock_batch, \
+             patch('main.topic_index.get_index', return_value=topic_index.PublishedIndex(':memory:')):
+            job = main.run_post_cycle(topic)
+            self.assertFalse(job['published'])
+            cycle = artifacts.get_store().get(job['cycle'])
+            self.assertEqual((cycle['stage'], cycle['title'], cycle['attempts']), (artifacts.WRITTEN, "Title", 1))
+
+            jobs = main.publish_pending()
+
+        self.assertEqual([j['published'] for j in jobs], [True])
+        mock_research.assert_called_once()
+        mock_write.assert_called_once()
+        mock_publish.assert_called_once()
+        # Pending posts go out together through the batching queue
+        mock_batch.assert_called_once()
+        self.assertEqual(mock_batch.call_args.args[0][0]['labels'], ["Checkpointed topic"])
+        self.assertEqual(artifacts.get_store().get(job['cycle'])['stage'], artifacts.PUBLISHED)
+        self.assertEqual(artifacts.get_store().pending(), [])
+
+    def test_post_cycle_resumes_after_crash(self):
+        topic = {'title': 'Interrupted topic', 'news_items': []}
+        index = topic_index.PublishedIndex(':memory:')
+        with patch('research.research_topic', return_value="Research context") as mock_research, \
+             patch('writer.generate_post', side_effect=[RuntimeError("killed"), {'title': "Title", 'content': "<p>Body</p>"}]), \
+             patch('publisher.publish_post', return_value=True), \
+             patch('main.topic_index.get_index', return_value=index):
+            self.assertIsNone(main.run_post_cycle(topic))
+            self.assertEqual(artifacts.get_store().find(topic['title'])['stage'], artifacts.RESEARCHED)
+
+            job = main.run_post_cycle(topic)
+
+        self.assertTrue(job['published'])
+        mock_research.assert_called_once()
+
+    def test_postprocess_cleans_generated_html(self):
+        raw = (
+            "```html\n<h1 class='big'>Launch   day</h1>\n<div><p onclick='x()'>  Artemis crews met NASA staff.\n"
+            "Artemis flies soon.</p>\n<p></p><script>track()</script>\n<p>NASA said <a href='javascript:x()'>more</a>"
+            " about NASA plans.</p><pre>a   b</pre></div>\n```"
+        )
+        post = postprocess.process(raw, topic="Moon mission")
+
+        self.assertEqual(post['content'],
+                         "<h2>Launch day</h2><p>Artemis crews met NASA staff. Artemis flies soon.</p>"
+                         "<p>NASA said <a>more</a> about NASA plans.</p><pre>a   b</pre>")
+        self.assertEqual(post['excerpt'], "Artemis crews met NASA staff. Artemis flies soon.")
+        self.assertEqual(post['labels'], ["Moon mission", "NASA", "Artemis"])
+
+        title_and_body = writer.parse_response("TITLE: **Moon   mission**\nCONTENT:\n" + raw, "Moon mission")
+        self.assertEqual(title_and_body['title'], "Moon mission")
+        self.assertEqual(title_and_body['content'], post['content'])
+
+    def test_search_merges_variants_and_caches(self):
+        results = {
+            "solar storm": ["http://a.com/1", "http://b.com/2#top", "http://c.com/3"],
+            "solar storm news": ["http://b.com/2", "http://d.com/4"],
+            '"solar storm" latest': ["http://d.com/4/", "http://b.com/2"],
+        }
+        provider = search.StaticProvider(results)
+        provider.search = MagicMock(side_effect=provider.search)
+        client = search.SearchClient(provider)
+
+        with patch('search._client', client):
+            urls = research.google_search("solar storm")
+            self.assertEqual(urls, ["http://b.com/2#top", "http://d.com/4", "http://a.com/1"])
+            self.assertEqual(research.google_search("solar storm"), urls)
+        self.assertEqual(provider.search.call_count, 3)
+
+    def test_search_falls_back_to_stale_results(self):
+        provider = search.StaticProvider({"eclipse": ["http://a.com/1"]})
+        client = search.SearchClient(provider)
+        self.assertEqual(client.search("eclipse", variants=1), ["http://a.com/1"])
+
+        provider.search = MagicMock(side_effect=RuntimeError("blocked"))
+        with patch('search.SEARCH_TTL', -1):
+            self.assertEqual(client.search("eclipse", variants=1), ["http://a.com/1"])
+        provider.search.assert_called_once()
+
+        # A provider without `search` fails when created, not mid-search
+        with self.assertRaises(TypeError):
+            type('Incomplete', (search.SearchProvider,), {})()
+
+    def test_aimd_limiter_grows_and_backs_off(self):
+        limiter = ratelimit.AIMDLimiter(initial=2, maximum=4, cooldown=60)
+        for _ in range(6):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.concurrency, 4)
+
+        token = limiter.acquire()
+        limiter.backoff('generate')
+        limiter.backoff('fetch')  # within the cooldown: ignored
+        limiter.release(token)    # finished during a backoff: no growth
+        self.assertEqual((limiter.concurrency, limiter.backoffs), (2, 1))
+
+    def test_backfill_runs_across_geos_and_backs_off(self):
+        topics = [{'title': f"Topic {i}", 'geo': geo, 'news_items': []}
+                  for i, geo in enumerate(['US', 'GB', 'US', 'IN', 'GB'])]
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def cycle(topic, geo='US', is_draft=False, publish=True):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            if topic['title'] == "Topic 0":
+                ratelimit.report_overload('generate')
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            if topic['title'] == "Topic 1":
+                # Skipped cycles don't count against the budget
+                return None
+            return {'topic': topic, 'geo': geo, 'is_draft': is_draft, 'title': topic['title'], 'content': "<p>x</p>"}
+
+        limiter = ratelimit.AIMDLimiter(initial=2, maximum=3, cooldown=60)
+        with patch('trends.get_trending_topics_multi', return_value=topics) as mock_trends, \
+             patch('main.run_post_cycle', side_effect=cycle), \
+             patch('publisher.publish_posts', side_effect=lambda posts: [{'success': True} for _ in posts]) as mock_batch, \
+             patch('main.topic_index.get_index', return_value=topic_index.PublishedIndex(':memory:')):
+            jobs = main.run_backfill(['US', 'GB', 'IN'], budget=4, limiter=limiter)
+
+        mock_trends.assert_called_once_with(['US', 'GB', 'IN'])
+        self.assertEqual([job['topic']['title'] for job in jobs], ["Topic 0", "Topic 2", "Topic 3", "Topic 4"])
+        self.assertTrue(all(job['is_draft'] and job['published'] for job in jobs))
+        # All drafts are sent in one batched publish
+        self.assertEqual(len(mock_batch.call_args_list), 1)
+        self.assertEqual(limiter.backoffs, 1)
+        self.assertLessEqual(peak[0], 3)
+        self.assertEqual(ratelimit._overload_listeners, [])
+
+    def test_backfill_publish_overload_lowers_concurrency(self):
+        topics = [{'title': f"Topic {i}", 'geo': 'US', 'news_items': []} for i in range(4)]
+
+        def cycle(topic, geo='US', is_draft=False, publish=True):
+            return {'topic': topic, 'is_draft': is_draft, 'title': topic['title'], 'content': "<p>x</p>"}
+
+        def publish_posts(posts):
+            ratelimit.report_overload('publish')
+            return [{'success': True} for _ in posts]
+
+        limiter = ratelimit.AIMDLimiter(initial=4, maximum=4, cooldown=0)
+        with patch('trends.get_trending_topics_multi', return_value=topics), \
+             patch('main.run_post_cycle', side_effect=cycle), \
+             patch('main.BACKFILL_PUBLISH_BATCH', 2), \
+             patch('publisher.publish_posts', side_effect=publish_posts) as mock_batch, \
+             patch('main.topic_index.get_index', return_value=topic_index.PublishedIndex(':memory:')):
+            jobs = main.run_backfill(['US'], budget=4, limiter=limiter)
+
+        self.assertTrue(all(job['published'] for job in jobs))
+        self.assertGreaterEqual(mock_batch.call_count, 2)
+        # Blogger overloads reach the limiter while the backfill is running
+        self.assertEqual(limiter.backoffs, mock_batch.call_count)
+        self.assertLess(limiter.concurrency, 4)
+
+    def test_benchmark_runs_offline(self):
+        import benchmark
+        report = benchmark.run(iterations=1, gemini_latency=0, article_latency=0, blogger_latency=0, batch_size=1)
+
+        names = [r['name'] for r in report['results']]
+        self.assertIn('run_post_cycle', names)
+        self.assertIn('run_batch', names)
+        self.assertGreater(report['requests']['gemini'], 0)
+        self.assertGreater(report['requests']['blogger'], 0)
+
     def test_writer_config(self):
         # Test that it raises error without key
         with self.assertRaises(ValueError):
@@ -0,0 +1,167 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Refresh the access token this long before it actually expires
+REFRESH_MARGIN = timedelta(minutes=5)
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on `path` (created if missing) across processes.
+    Uses flock where available and msvcrt byte locking on Windows.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def needs_refresh(creds, margin=REFRESH_MARGIN):
+    """
+    Returns True if `creds` are missing, invalid or within `margin` of expiring.
+    """
+    if not creds:
+        return True
+    expiry = getattr(creds, 'expiry', None)
+    if expiry and getattr(creds, 'refresh_token', None):
+        # google-auth stores expiry as a naive UTC datetime
+        return expiry - datetime.utcnow() < margin
+    return not creds.valid
+
+def _refresh(creds):
+    from google.auth.transport.requests import Request
+    creds.refresh(Request())
+
+class TokenStore:
+    """
+    OAuth credentials kept in one pickle file and shared by every thread and process.
+
+    Fresh credentials are served from memory. When they are about to expire,
+    one caller takes the file lock, re-reads the file (another process may
+    already have refreshed it) and only refreshes if it is still stale; the
+    result is written to a temporary file and swapped in with os.replace, so
+    readers never see a half-written token.
+    """
+
+    def __init__(self, path, margin=REFRESH_MARGIN, refresh=_refresh):
+        self.path = path
+        self.margin = margin
+        self._refresh = refresh
+        self._creds = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the credentials from disk, or returns None if there are none.
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except (EOFError, pickle.UnpicklingError) as e:
+            print(f"Ignoring unreadable token file {self.path}: {e}")
+            return None
+
+    def save(self, creds):
+        """
+        Atomically replaces the token file with `creds`.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix='.token-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(creds, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def get(self, login=None):
+        """
+        Returns valid credentials, refreshing them at most once per expiry.
+
+        Args:
+            login (callable): Called under the lock to sign in when there are no
+                usable credentials; should return new credentials or None.
+
+        Returns:
+            Credentials or None if they could not be obtained.
+        """
+        creds = self._creds
+        if not needs_refresh(creds, self.margin):
+            return creds
+
+        with self._lock:
+            if not needs_refresh(self._creds, self.margin):
+                return self._creds
+
+            with file_lock(self.path + '.lock'):
+                creds = self.load()
+                if not needs_refresh(creds, self.margin):
+                    self._creds = creds
+                    return creds
+
+                if creds and getattr(creds, 'refresh_token', None):
+                    try:
+                        self._refresh(creds)
+                        metrics.incr('token_refreshes')
+                    except Exception as e:
+                        print(f"Error refreshing token: {e}. Re-authenticating...")
+                        creds = None
+                else:
+                    creds = None
+
+                if creds is None and login:
+                    creds = login()
+                if creds is None:
+                    return None
+
+                self.save(creds)
+                self._creds = creds
+                return creds
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(path='token.pickle'):
+    """
+    Returns the process-wide store for the token file at `path`.
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = TokenStore(path)
+            _stores[key] = store
+        return store
@@ -0,0 +1,208 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+# SQLite file holding everything that was published
+INDEX_PATH = 'published_index.db'
+
+# Fingerprints this many bits apart (or fewer) count as the same story
+MAX_DISTANCE = 3
+
+# The 64-bit fingerprint is split into this many bands for lookup.
+# Must be greater than MAX_DISTANCE so near matches share at least one band.
+BANDS = 4
+
+# Texts with at most this many words are fingerprinted without word pairs
+SHORT_TEXT = 12
+
+# Only posts published within this many seconds count as duplicates, so
+# recurring trends (fixtures, lottery draws) can be covered again (None: forever)
+LOOKBACK = 7 * 24 * 60 * 60
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how in is it its of on or that the this to
+was were what when where who why will with after over new news today latest
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_index = None
+_index_lock = threading.Lock()
+
+def _features(text):
+    raw = _WORD.findall(text.lower().replace("'s", ""))
+    words = []
+    for word in raw:
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s'):
+            word = word[:-1]
+        words.append(word)
+    if not words:
+        # Titles made only of stopwords ("The Who") keep their words rather than hashing to 0
+        words = raw
+    if len(words) <= SHORT_TEXT:
+        # Short titles: a bag of words, so reordered headlines still match
+        return words
+    # Longer text: single words plus adjacent pairs, so word order matters a little
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def simhash(text):
+    """
+    Returns the 64-bit SimHash of `text`. Rewordings of the same story
+    land a few bits apart; unrelated text is ~32 bits apart.
+    """
+    weights = [0] * 64
+    for feature in _features(text):
+        h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class _BandIndex:
+    """
+    In-memory lookup of fingerprints by band, so a query only compares
+    against fingerprints sharing at least one 16-bit band with it.
+    """
+
+    def __init__(self):
+        self._bands = [{} for _ in range(BANDS)]
+
+    def add(self, fingerprint, row_id):
+        for i, key in enumerate(self._keys(fingerprint)):
+            self._bands[i].setdefault(key, []).append((fingerprint, row_id))
+
+    def find(self, fingerprint, max_distance=MAX_DISTANCE, accept=None):
+        best = None
+        for i, key in enumerate(self._keys(fingerprint)):
+            for candidate, row_id in self._bands[i].get(key, ()):
+                if accept is not None and not accept(row_id):
+                    continue
+                distance = hamming(fingerprint, candidate)
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id)
+        return best
+
+    @staticmethod
+    def _keys(fingerprint):
+        width = 64 // BANDS
+        mask = (1 << width) - 1
+        return [fingerprint >> (i * width) & mask for i in range(BANDS)]
+
+class PublishedIndex:
+    """
+    Persistent record of published posts with near-duplicate lookup.
+
+    Topic titles and post contents are fingerprinted with SimHash. All
+    fingerprints are loaded into banded in-memory indexes on start, so a
+    lookup touches only a handful of candidates even with tens of
+    thousands of past posts.
+
+    Args:
+        path (str): SQLite file (":memory:" for a throwaway index).
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS posts ('
+            ' id INTEGER PRIMARY KEY,'
+            ' topic TEXT NOT NULL,'
+            ' title TEXT,'
+            ' url TEXT,'
+            ' topic_hash INTEGER NOT NULL,'
+            ' content_hash INTEGER,'
+            ' published_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+        self._topics = _BandIndex()
+        self._contents = _BandIndex()
+        self._rows = {}
+        for row in self._conn.execute('SELECT id, topic, title, topic_hash, content_hash, published_at FROM posts'):
+            self._load(row[0], row[1], row[2], _unsigned(row[3]), _unsigned(row[4]), row[5])
+
+    def _load(self, row_id, topic, title, topic_hash, content_hash, published_at):
+        self._rows[row_id] = {'topic': topic, 'title': title, 'published_at': published_at}
+        self._topics.add(topic_hash, row_id)
+        if content_hash is not None:
+            self._contents.add(content_hash, row_id)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def find_duplicate(self, topic, content=None, lookback=LOOKBACK):
+        """
+        Looks for a recent post about the same story.
+
+        Args:
+            topic (str): Trend title (checked before any research is done).
+            content (str): Optional generated post text to compare as well.
+            lookback (float): Only posts from the last `lookback` seconds count (None: all).
+
+        Returns:
+            dict: {'topic', 'title', 'published_at', 'distance'} of the closest earlier post, or None.
+        """
+        accept = None
+        if lookback is not None:
+            since = time.time() - lookback
+            accept = lambda row_id: self._rows[row_id]['published_at'] >= since
+        with self._lock:
+            match = self._topics.find(simhash(topic), accept=accept)
+            if match is None and content:
+                match = self._contents.find(simhash(content), accept=accept)
+            if match is None:
+                return None
+            distance, row_id = match
+            return dict(self._rows[row_id], distance=distance)
+
+    def add(self, topic, title=None, content=None, url=None):
+        """
+        Records a published post.
+        """
+        topic_hash = simhash(topic)
+        content_hash = simhash(content) if content else None
+        published_at = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT INTO posts (topic, title, url, topic_hash, content_hash, published_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (topic, title, url, _signed(topic_hash), _signed(content_hash), published_at)
+            )
+            self._conn.commit()
+            self._load(cursor.lastrowid, topic, title, topic_hash, content_hash, published_at)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _unsigned(value):
+    if value is None:
+        return None
+    return value + (1 << 64) if value < 0 else value
+
+def get_index():
+    """
+    Returns the process-wide PublishedIndex stored at INDEX_PATH.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PublishedIndex(INDEX_PATH)
+        return _index
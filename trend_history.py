@@ -0,0 +1,239 @@
+import math
+import sqlite3
+import threading
+import time
+
+import topic_index
+
+# SQLite file holding every poll of the trends feeds (None disables recording)
+HISTORY_PATH = 'trend_history.db'
+
+# An unchanged topic gets a new snapshot at most this often (seconds)
+SNAPSHOT_INTERVAL = 60 * 60
+
+# Snapshots older than this are pruned (seconds)
+RETENTION = 180 * 24 * 60 * 60
+
+# Growth is measured against the traffic seen this long ago (seconds)
+MOMENTUM_WINDOW = 2 * 60 * 60
+
+# A topic's freshness halves every FRESHNESS_HALF_LIFE seconds after it first trended
+FRESHNESS_HALF_LIFE = 6 * 60 * 60
+
+# Weights of the score components
+GROWTH_WEIGHT = 1.0
+FRESHNESS_WEIGHT = 1.0
+VOLUME_WEIGHT = 0.25
+
+_history = None
+_history_lock = threading.Lock()
+
+def topic_key(title):
+    return ' '.join(title.lower().split())
+
+class TrendHistory:
+    """
+    Time series of trending topics per geo.
+
+    Each topic has one summary row (first/last seen, latest and peak
+    traffic) and a compact snapshot table keyed by (topic, time). A poll
+    only adds a snapshot when a topic's traffic or rank changed, or once
+    per SNAPSHOT_INTERVAL, so frequent polling stays small. Scoring reads
+    the summary rows plus one indexed snapshot lookup per topic, so it
+    does not slow down as months of history pile up.
+
+    Args:
+        path (str): SQLite file (":memory:" for a throwaway store).
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS topics ('
+            ' id INTEGER PRIMARY KEY,'
+            ' geo TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' title TEXT NOT NULL,'
+            ' first_seen INTEGER NOT NULL,'
+            ' last_seen INTEGER NOT NULL,'
+            ' traffic INTEGER NOT NULL,'
+            ' peak_traffic INTEGER NOT NULL,'
+            ' rank INTEGER NOT NULL,'
+            ' last_snapshot INTEGER NOT NULL,'
+            ' UNIQUE (geo, key));'
+            'CREATE TABLE IF NOT EXISTS snapshots ('
+            ' topic_id INTEGER NOT NULL,'
+            ' at INTEGER NOT NULL,'
+            ' traffic INTEGER NOT NULL,'
+            ' rank INTEGER NOT NULL,'
+            ' PRIMARY KEY (topic_id, at)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS snapshots_at ON snapshots (at);'
+        )
+        self._conn.commit()
+        self._last_prune = 0
+
+    def record(self, geo, topics, at=None):
+        """
+        Records one poll of `geo`'s feed: `topics` in feed order.
+        """
+        at = int(at if at is not None else time.time())
+        with self._lock:
+            for rank, topic in enumerate(topics):
+                key = topic_key(topic['title'])
+                traffic = int(topic.get('traffic') or 0)
+                row = self._conn.execute(
+                    'SELECT id, traffic, rank, last_snapshot FROM topics WHERE geo = ? AND key = ?', (geo, key)
+                ).fetchone()
+                if row is None:
+                    cursor = self._conn.execute(
+                        'INSERT INTO topics (geo, key, title, first_seen, last_seen, traffic, peak_traffic,'
+                        ' rank, last_snapshot) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (geo, key, topic['title'], at, at, traffic, traffic, rank, at)
+                    )
+                    snapshot = (cursor.lastrowid, at, traffic, rank)
+                else:
+                    topic_id, old_traffic, old_rank, last_snapshot = row
+                    changed = traffic != old_traffic or rank != old_rank
+                    take = changed or at - last_snapshot >= SNAPSHOT_INTERVAL
+                    self._conn.execute(
+                        'UPDATE topics SET last_seen = ?, traffic = ?, peak_traffic = MAX(peak_traffic, ?),'
+                        ' rank = ?, last_snapshot = ? WHERE id = ?',
+                        (at, traffic, traffic, rank, at if take else last_snapshot, topic_id)
+                    )
+                    snapshot = (topic_id, at, traffic, rank) if take else None
+                if snapshot:
+                    self._conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)', snapshot)
+            self._conn.commit()
+
+        if at - self._last_prune >= SNAPSHOT_INTERVAL:
+            self.prune(at - RETENTION)
+            self._last_prune = at
+
+    def prune(self, before):
+        """
+        Deletes snapshots taken before `before` (unix time).
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM snapshots WHERE at < ?', (int(before),))
+            self._conn.commit()
+
+    def history(self, geo, title):
+        """
+        Returns [(time, traffic, rank), ...] for one topic, oldest first.
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT s.at, s.traffic, s.rank FROM snapshots s JOIN topics t ON t.id = s.topic_id'
+                ' WHERE t.geo = ? AND t.key = ? ORDER BY s.at', (geo, topic_key(title))
+            ).fetchall()
+
+    def stats(self, geo, titles, now):
+        """
+        Returns {key: (first_seen, traffic MOMENTUM_WINDOW ago or at first sight)} for `titles`.
+        """
+        keys = list({topic_key(title) for title in titles})
+        if not keys:
+            return {}
+        marks = ','.join('?' * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT t.key, t.first_seen, COALESCE('
+                ' (SELECT s.traffic FROM snapshots s WHERE s.topic_id = t.id AND s.at <= ?'
+                '  ORDER BY s.at DESC LIMIT 1),'
+                ' (SELECT s.traffic FROM snapshots s WHERE s.topic_id = t.id ORDER BY s.at LIMIT 1))'
+                f' FROM topics t WHERE t.geo = ? AND t.key IN ({marks})',
+                (int(now - MOMENTUM_WINDOW), geo, *keys)
+            ).fetchall()
+        return {key: (first_seen, baseline) for key, first_seen, baseline in rows}
+
+    def score(self, topics, geo=None, now=None):
+        """
+        Scores `topics` by momentum.
+
+        The score adds traffic growth over MOMENTUM_WINDOW (as a log ratio),
+        freshness (halving every FRESHNESS_HALF_LIFE since the topic first
+        trended) and a small weight for current volume. Topics never
+        recorded count as brand new with no growth yet.
+
+        A topic merged from several geos (its 'geos') carries their summed
+        traffic, so it is compared against the sum of those geos' baselines.
+
+        Args:
+            topics (list): Topic records or dictionaries.
+            geo (str): Country of all topics (default: each topic's 'geos' or 'geo').
+
+        Returns:
+            list: Scores, in the order of `topics`.
+        """
+        now = now if now is not None else time.time()
+        topic_geos = [[geo] if geo else (topic.get('geos') or [topic.get('geo') or 'US']) for topic in topics]
+        titles = {}
+        for topic, geos in zip(topics, topic_geos):
+            for topic_geo in geos:
+                titles.setdefault(topic_geo, []).append(topic['title'])
+        known = {topic_geo: self.stats(topic_geo, geo_titles, now) for topic_geo, geo_titles in titles.items()}
+
+        scores = []
+        for topic, geos in zip(topics, topic_geos):
+            traffic = int(topic.get('traffic') or 0)
+            key = topic_key(topic['title'])
+            seen = [known[topic_geo][key] for topic_geo in geos if key in known[topic_geo]]
+            if seen:
+                first_seen = min(first for first, _ in seen)
+                baseline = sum(base or 0 for _, base in seen)
+            else:
+                first_seen, baseline = now, traffic
+            growth = math.log1p(traffic) - math.log1p(baseline)
+            freshness = 0.5 ** (max(0.0, now - first_seen) / FRESHNESS_HALF_LIFE)
+            volume = math.log10(1 + traffic) / 6
+            scores.append(GROWTH_WEIGHT * growth + FRESHNESS_WEIGHT * freshness + VOLUME_WEIGHT * volume)
+        return scores
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_history():
+    """
+    Returns the shared trend history, or None if HISTORY_PATH is unset.
+    """
+    global _history
+    with _history_lock:
+        if _history is None and HISTORY_PATH:
+            _history = TrendHistory(HISTORY_PATH)
+        return _history
+
+def record(geo, topics):
+    """
+    Adds a poll of `geo` to the shared history (no-op when disabled).
+    """
+    history = get_history()
+    if history and topics:
+        try:
+            history.record(geo, topics)
+        except sqlite3.Error as e:
+            print(f"Could not record trend history: {e}")
+
+def rank_topics(topics, geo=None, index=None, now=None):
+    """
+    Orders topics by momentum, rising ones first, leaving out anything
+    already published.
+
+    Args:
+        topics (list): Topics from trends (records or dictionaries).
+        geo (str): Country the topics come from (default: each topic's 'geos' or 'geo').
+        index (PublishedIndex): Duplicate index (default: the shared one).
+
+    Returns:
+        list: The unpublished topics, best first. Equal scores keep feed order.
+    """
+    index = index if index is not None else topic_index.get_index()
+    fresh = [topic for topic in topics if not index.find_duplicate(topic['title'])]
+    history = get_history()
+    if not history or not fresh:
+        return fresh
+
+    scores = history.score(fresh, geo, now)
+    order = sorted(range(len(fresh)), key=lambda position: -scores[position])
+    return [fresh[position] for position in order]
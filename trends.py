@@ -1,91 +1,312 @@
-import feedparser
+import io
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def get_trending_topics(geo='US'):
+import requests
+from lxml import etree
+
+import metrics
+import trend_history
+
+# Google Trends RSS feed, formatted with the country code (URL that works as of 2025)
+RSS_URL = 'https://trends.google.com/trending/rss?geo={geo}'
+
+# Seconds a fetched feed is served from memory before asking Google again
+CACHE_TTL = 300
+
+# Upper bound on feeds downloaded at the same time in multi-geo mode
+MAX_GEO_WORKERS = 8
+
+# Seconds to wait for the feed
+TIMEOUT = 10
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
+
+# geo -> {'fetched': monotonic time, 'etag': ..., 'modified': ..., 'topics': [...]}
+_cache = {}
+_cache_lock = threading.Lock()
+
+_session = None
+_session_lock = threading.Lock()
+
+_TRAFFIC = re.compile(r'([\d.,]+)\s*([KMB]?)', re.I)
+_MULTIPLIERS = {'': 1, 'K': 1000, 'M': 1000000, 'B': 1000000000}
+
+class _Record:
+    """
+    Slotted record that can also be read like the dictionaries it replaces:
+    record['title'], record.get('source'), dict(record).
+    """
+
+    __slots__ = ()
+    # Dictionary key -> attribute name
+    KEYS = {}
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self.KEYS[key])
+        except (KeyError, AttributeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def keys(self):
+        return self.KEYS.keys()
+
+    def to_dict(self):
+        return {key: self[key] for key in self.KEYS}
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+class NewsItem(_Record):
+    """
+    One article Google lists under a trending topic.
+    """
+
+    __slots__ = ('title', 'url', 'source', 'picture')
+    KEYS = {name: name for name in __slots__}
+
+    def __init__(self, title=None, url=None, source=None, picture=None):
+        self.title = title
+        self.url = url
+        self.source = source
+        self.picture = picture
+
+class Topic(_Record):
+    """
+    One trending search, with its approximate traffic as an integer
+    ("20K+" becomes 20000) and the news items Google attached to it.
+    'geos' is only set on topics merged from several feeds.
+    """
+
+    __slots__ = ('title', 'link', 'pub_date', 'traffic', 'picture', 'news_items', 'geo', 'geos')
+    KEYS = {
+        'title': 'title', 'link': 'link', 'pubDate': 'pub_date', 'traffic': 'traffic',
+        'picture': 'picture', 'news_items': 'news_items', 'geo': 'geo', 'geos': 'geos'
+    }
+
+    def __init__(self, title=None, link=None, pub_date=None, traffic=0, picture=None,
+                 news_items=None, geo=None, geos=None):
+        self.title = title
+        self.link = link
+        self.pub_date = pub_date
+        self.traffic = traffic
+        self.picture = picture
+        self.news_items = news_items if news_items is not None else []
+        self.geo = geo
+        self.geos = geos
+
+    def copy(self, **changes):
+        topic = Topic(*(getattr(self, name) for name in self.__slots__))
+        for name, value in changes.items():
+            setattr(topic, name, value)
+        return topic
+
+    def to_dict(self):
+        data = super().to_dict()
+        data['news_items'] = [item.to_dict() if isinstance(item, _Record) else item for item in self.news_items]
+        return data
+
+def parse_traffic(text):
+    """
+    Turns Google's approximate traffic ("200+", "20K+", "1.5M+", "10,000+") into an int.
+    """
+    match = _TRAFFIC.search(text or '')
+    if not match:
+        return 0
+    number = float(match.group(1).replace(',', '') or 0)
+    return int(number * _MULTIPLIERS[match.group(2).upper()])
+
+def get_session():
+    """
+    Returns the requests.Session reused for every feed poll.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+        return _session
+
+def clear_cache():
+    """
+    Forgets all cached feeds.
+    """
+    with _cache_lock:
+        _cache.clear()
+
+def get_trending_topics(geo='US', max_age=CACHE_TTL):
     """
     Fetches trending topics from Google Trends RSS feed.
 
+    Results are cached per geo for `max_age` seconds. After that the feed is
+    re-requested with its ETag/Last-Modified, so an unchanged feed (HTTP 304)
+    is not downloaded or parsed again. Every poll that reaches Google is
+    added to the trend history.
+
     Args:
         geo (str): The country code (e.g., 'US', 'GB', 'IN').
+        max_age (int): Seconds a cached result stays fresh (0 to always revalidate).
 
     Returns:
-        list: A list of dictionaries containing topic details.
-              Each dictionary has 'title', 'link', 'traffic', 'news_items'.
+        list: Topic records ('title', 'link', 'pubDate', 'traffic' (int),
+              'picture', 'news_items', 'geo'), readable as dictionaries.
     """
-    # Updated URL that works as of 2025
-    rss_url = f'https://trends.google.com/trending/rss?geo={geo}'
-    feed = feedparser.parse(rss_url)
+    with _cache_lock:
+        cached = _cache.get(geo)
+    if cached and max_age and time.monotonic() - cached['fetched'] < max_age:
+        metrics.incr('cache_hits', cache='trends')
+        return list(cached['topics'])
+    metrics.incr('cache_misses', cache='trends')
+
+    headers = {}
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached['modified']:
+        headers['If-Modified-Since'] = cached['modified']
+
+    try:
+        with metrics.timed('trends'):
+            response = get_session().get(RSS_URL.format(geo=geo), headers=headers, timeout=TIMEOUT)
+    except requests.RequestException as e:
+        print(f"Error fetching trends for {geo}: {e}")
+        return list(cached['topics']) if cached else []
+
+    if cached and response.status_code == 304:
+        # Feed unchanged since last fetch
+        metrics.incr('cache_revalidated', cache='trends')
+        with _cache_lock:
+            cached['fetched'] = time.monotonic()
+        trend_history.record(geo, cached['topics'])
+        return list(cached['topics'])
 
     trends = []
+    if response.status_code == 200:
+        with metrics.timed('trends_parse'):
+            trends = parse_feed(response.content, geo)
+    else:
+        print(f"Failed to fetch trends for {geo}: HTTP {response.status_code}")
+
+    if trends:
+        trend_history.record(geo, trends)
+        with _cache_lock:
+            _cache[geo] = {
+                'fetched': time.monotonic(),
+                'etag': response.headers.get('ETag'),
+                'modified': response.headers.get('Last-Modified'),
+                'topics': trends
+            }
+    elif cached:
+        # Keep serving the last good copy if the refresh failed
+        return list(cached['topics'])
+
+    return list(trends)
+
+def get_trending_topics_multi(geos, max_age=CACHE_TTL):
+    """
+    Fetches several geo feeds concurrently and merges them.
+
+    Topics are interleaved by rank (each geo's #1 first, then each #2, ...).
+    A topic trending in several geos appears once, with all of its geos in
+    'geos', the news items of every feed combined and the traffic summed.
+
+    Args:
+        geos (list): Country codes, e.g. ['US', 'GB', 'IN'].
+        max_age (int): Passed to get_trending_topics.
+
+    Returns:
+        list: Merged Topic records.
+    """
+    if not geos:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(MAX_GEO_WORKERS, len(geos))) as pool:
+        per_geo = list(pool.map(lambda g: get_trending_topics(g, max_age=max_age), geos))
+
+    merged = []
+    by_title = {}
+    longest = max(len(topics) for topics in per_geo)
+    for rank in range(longest):
+        for geo, topics in zip(geos, per_geo):
+            if rank >= len(topics):
+                continue
+            topic = topics[rank]
+            key = topic['title'].strip().lower()
+            existing = by_title.get(key)
+            if existing is None:
+                existing = topic.copy(geos=[geo], news_items=list(topic.news_items))
+                by_title[key] = existing
+                merged.append(existing)
+                continue
+            existing.geos.append(geo)
+            existing.traffic += topic.traffic
+            seen = {item.url for item in existing.news_items}
+            for item in topic.news_items:
+                if item.url not in seen:
+                    existing.news_items.append(item)
+                    seen.add(item.url)
+
+    return merged
+
+def parse_feed(data, geo):
+    """
+    Parses a Google Trends RSS document (bytes) with lxml's iterparse.
+
+    Items are read one at a time and cleared once converted, and the `ht:`
+    elements are matched by local name, so feeds using the older namespace
+    URI parse the same way.
+
+    Returns:
+        list: Topic records.
+    """
+    topics = []
+    try:
+        for _, item in etree.iterparse(io.BytesIO(data), events=('end',), tag='item', recover=True):
+            topic = Topic(geo=geo)
+            for child in item:
+                name = etree.QName(child).localname
+                if name == 'news_item':
+                    news = NewsItem()
+                    for field in child:
+                        attr = etree.QName(field).localname[len('news_item_'):]
+                        if attr in NewsItem.__slots__:
+                            setattr(news, attr, (field.text or '').strip() or None)
+                    if news.title and news.url:
+                        topic.news_items.append(news)
+                elif name == 'approx_traffic':
+                    topic.traffic = parse_traffic(child.text)
+                elif name == 'pubDate':
+                    topic.pub_date = (child.text or '').strip() or None
+                elif name in ('title', 'link', 'picture'):
+                    setattr(topic, name, (child.text or '').strip() or None)
+            if topic.title:
+                topics.append(topic)
 
-    if feed.bozo:
-        print(f"Error parsing feed: {feed.bozo_exception}")
-        # Sometimes feedparser reports bozo for minor XML errors but still parses content.
-        if not feed.entries:
-            return []
-
-    for entry in feed.entries:
-        topic_data = {
-            'title': entry.title,
-            'link': entry.link,
-            'pubDate': getattr(entry, 'published', 'N/A'),
-            'traffic': getattr(entry, 'ht_approx_traffic', 'N/A'),
-            'news_items': []
-        }
-
-        # feedparser puts repeated elements like <ht:news_item> into a specific list if defined,
-        # or we might need to look at 'ht_news_item' (singular) if it only captures the first one
-        # or 'ht_news_item_title' etc.
-
-        # In recent feedparser versions with this feed:
-        # entry.ht_news_item might be a list of dictionaries if multiple exist.
-
-        # Let's try to extract news items safely.
-        # Often 'ht_news_item' is the list.
-        news_items = getattr(entry, 'ht_news_item', [])
-
-        # If it's a single item (dict) instead of list, wrap it
-        if isinstance(news_items, dict):
-            news_items = [news_items]
-
-        for item in news_items:
-            # item is a dictionary-like object (FeedParserDict)
-            # The keys inside might be 'ht_news_item_title', 'ht_news_item_url', etc.
-            # OR simple 'title', 'url' depending on how feedparser flattened it.
-            # Based on standard feedparser behavior for namespaced elements:
-
-            title = item.get('ht_news_item_title') or item.get('title')
-            url = item.get('ht_news_item_url') or item.get('url')
-            source = item.get('ht_news_item_source') or item.get('source')
-
-            if title and url:
-                topic_data['news_items'].append({
-                    'title': title,
-                    'url': url,
-                    'source': source
-                })
-
-        # Fallback: sometimes feedparser maps flattened attributes to the entry itself
-        # if the structure is simple or if it only captured the first one.
-        if not topic_data['news_items']:
-            # Check for flattened attributes like 'ht_news_item_title'
-            title = getattr(entry, 'ht_news_item_title', None)
-            url = getattr(entry, 'ht_news_item_url', None)
-            if title and url:
-                topic_data['news_items'].append({
-                    'title': title,
-                    'url': url,
-                    'source': getattr(entry, 'ht_news_item_source', None)
-                })
-
-        trends.append(topic_data)
-
-    return trends
+            # Drop parsed items so memory stays flat however long the feed is
+            item.clear()
+            while item.getprevious() is not None:
+                del item.getparent()[0]
+    except etree.XMLSyntaxError as e:
+        print(f"Error parsing feed for {geo}: {e}")
+    return topics
 
 if __name__ == "__main__":
     # Test the function
     topics = get_trending_topics()
     print(f"Found {len(topics)} trending topics.")
     for i, t in enumerate(topics[:5], 1):
-        print(f"{i}. {t['title']} ({t['traffic']})")
-        for news in t['news_items'][:2]:
-            print(f"   - {news['title']} ({news['source']})")
+        print(f"{i}. {t.title} ({t.traffic:,}+)")
+        for news in t.news_items[:2]:
+            print(f"   - {news.title} ({news.source})")
@@ -1,5 +1,60 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
+import random
+import threading
+import time
+
+import cache
+import metrics
+import postprocess
+import ratelimit
+
+# Gemini model used for writing posts
+MODEL_NAME = 'gemini-pro'
+
+# Version of the prompt template and cached post format; part of the generation cache key
+PROMPT_VERSION = 2
+
+# SQLite file caching generated posts (None disables the cache)
+GENERATION_CACHE_PATH = 'generation_cache.db'
+
+# Size limit of the generation cache, in bytes of stored posts
+GENERATION_CACHE_BYTES = 20 * 1024 * 1024
+
+# Account quota (Gemini free tier defaults); override before the first call
+REQUESTS_PER_MINUTE = 15
+TOKENS_PER_MINUTE = 1000000
+
+# Tokens reserved for the reply when charging a request against TOKENS_PER_MINUTE
+OUTPUT_TOKENS = 2048
+
+# Parallel generations in write_many
+MAX_WORKERS = 4
+
+# Retry policy for quota and transient errors
+MAX_RETRIES = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+_models = {}
+_models_lock = threading.Lock()
+
+_generation_cache = None
+_generation_cache_lock = threading.Lock()
+
+_clients = {}
+_clients_lock = threading.Lock()
 
 def configure_ai(api_key=None):
     """
@@ -13,16 +68,122 @@ def configure_ai(api_key=None):
 
     genai.configure(api_key=api_key)
 
-def write_blog_post(topic, research_context):
+def get_model(model_name=MODEL_NAME):
+    """
+    Returns a GenerativeModel for `model_name`, creating it only once per process.
     """
-    Generates a blog post title and content using Gemini.
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _models[model_name] = model
+        return model
 
-    Returns:
-        tuple: (title, html_content)
+class GeminiClient:
+    """
+    Gemini client shared by all writer threads.
+
+    Every call is charged against a requests-per-minute and a
+    tokens-per-minute bucket. Quota (429) and transient errors are retried
+    with exponential backoff and full jitter; a quota error also pauses the
+    shared buckets so concurrent callers back off together.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, rpm=None, tpm=None, max_retries=MAX_RETRIES):
+        self.model_name = model_name
+        self.requests = ratelimit.TokenBucket(rpm or REQUESTS_PER_MINUTE)
+        self.tokens = ratelimit.TokenBucket(tpm or TOKENS_PER_MINUTE)
+        self.max_retries = max_retries
+
+    def generate(self, prompt):
+        """
+        Returns the text Gemini generates for `prompt`.
+        Raises the last error if all retries fail.
+        """
+        cost = len(prompt) // 4 + OUTPUT_TOKENS
+        attempt = 0
+        while True:
+            self.requests.acquire()
+            self.tokens.acquire(cost)
+            try:
+                with metrics.timed('generate'):
+                    response = get_model(self.model_name).generate_content(prompt)
+                record_usage(response, prompt)
+                return response.text
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                if is_quota_error(e):
+                    self.requests.pause(delay)
+                if is_quota_error(e) or isinstance(e, google_exceptions.DeadlineExceeded):
+                    ratelimit.report_overload('generate')
+                print(f"Gemini busy ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                attempt += 1
+
+def record_usage(response, prompt):
+    """
+    Counts LLM tokens in and out, from the API's usage report when present.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    tokens_in = getattr(usage, 'prompt_token_count', None)
+    tokens_out = getattr(usage, 'candidates_token_count', None)
+    if not isinstance(tokens_in, int):
+        tokens_in = len(prompt) // 4
+    if not isinstance(tokens_out, int):
+        tokens_out = len(response.text) // 4
+    metrics.incr('llm_tokens', tokens_in, direction='in')
+    metrics.incr('llm_tokens', tokens_out, direction='out')
+
+def is_quota_error(error):
+    return isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)) \
+        or '429' in str(error)
+
+def is_retryable(error):
+    return isinstance(error, RETRYABLE_ERRORS) or is_quota_error(error)
+
+def get_client(model_name=MODEL_NAME):
+    """
+    Returns the process-wide GeminiClient for `model_name`.
+    Gemini quotas are per model, so each model gets its own limits.
+    """
+    with _clients_lock:
+        client = _clients.get(model_name)
+        if client is None:
+            client = GeminiClient(model_name)
+            _clients[model_name] = client
+        return client
+
+def get_generation_cache():
+    """
+    Returns the shared on-disk generation cache, or None if GENERATION_CACHE_PATH is unset.
     """
-    model = genai.GenerativeModel('gemini-pro')
+    global _generation_cache
+    with _generation_cache_lock:
+        if _generation_cache is None and GENERATION_CACHE_PATH:
+            _generation_cache = cache.DiskCache(GENERATION_CACHE_PATH, GENERATION_CACHE_BYTES)
+        return _generation_cache
 
-    prompt = f"""
+def generation_key(topic, research_context, model_name=MODEL_NAME, style=None, variant=None):
+    """
+    Cache key for a generation: model, prompt template version and a hash of the inputs.
+    `variant` separates generations that must not share a cached post (e.g. one per blog).
+    """
+    inputs = f"{topic}\0{research_context}" if not style else f"{topic}\0{research_context}\0{style}"
+    if variant:
+        inputs = f"{inputs}\0variant={variant}"
+    digest = hashlib.sha256(inputs.encode('utf-8')).hexdigest()
+    return f"{model_name}:v{PROMPT_VERSION}:{digest}"
+
+def build_prompt(topic, research_context, style=None):
+    """
+    Fills in the blog post prompt template.
+    `style` adds blog-specific writing instructions (e.g. audience or tone).
+    Bump PROMPT_VERSION whenever this template changes.
+    """
+    extra = f"\n    6. {style}" if style else ""
+    return f"""
     You are an expert news blogger and journalist. Your task is to write a high-quality, engaging blog post about the following topic based on the provided research.
 
     TOPIC: {topic}
@@ -35,7 +196,7 @@ def write_blog_post(topic, research_context):
     2. Write the body of the post in clean HTML format (use <p>, <h2>, <ul>, etc.). Do not include <html> or <body> tags, just the content.
     3. The tone should be professional yet accessible and engaging.
     4. Synthesize the information from the research context. Do not make up facts not present in the context (unless it's general knowledge).
-    5. At the end, include a "Conclusion" or "Takeaway" section.
+    5. At the end, include a "Conclusion" or "Takeaway" section.{extra}
 
     OUTPUT FORMAT:
     Please output the response in this exact format:
@@ -45,30 +206,90 @@ def write_blog_post(topic, research_context):
     [Your HTML Content Here]
     """
 
-    try:
-        response = model.generate_content(prompt)
-        text = response.text
+def parse_response(text, topic=None):
+    """
+    Splits Gemini's reply into a title and cleaned-up HTML.
+
+    Returns:
+        dict: 'title', 'content', 'excerpt' and 'labels' (see postprocess.process).
+    """
+    title = "Untitled Post"
+    content = text
+
+    if "TITLE:" in text and "CONTENT:" in text:
+        title_part, content = text.split("CONTENT:", 1)
+        title = postprocess.clean_title(title_part.replace("TITLE:", "")) or title
+
+    with metrics.timed('postprocess'):
+        post = postprocess.process(content, topic)
+    post['title'] = title
+    return post
+
+def generate_post(topic, research_context, model_name=MODEL_NAME, use_cache=True, style=None, variant=None):
+    """
+    Generates a blog post using Gemini.
+
+    Results are cached on disk by model, prompt version and inputs, so
+    re-running the same topic and context costs no LLM call. `style` adds
+    blog-specific writing instructions to the prompt; `variant` (such as a
+    blog name) keeps the cached post of one target from being reused by another.
 
-        # Parse the output
-        title = "Untitled Post"
-        content = text
+    Returns:
+        dict: 'title', 'content' (cleaned HTML), 'excerpt' and 'labels',
+              or None if generation failed.
+    """
+    key = generation_key(topic, research_context, model_name, style, variant)
+    store = get_generation_cache() if use_cache else None
+    if store:
+        entry = store.get(key)
+        metrics.incr('cache_hits' if entry else 'cache_misses', cache='generation')
+        if entry:
+            print("♻️ Using cached generation.")
+            return entry['value']
 
-        if "TITLE:" in text and "CONTENT:" in text:
-            parts = text.split("CONTENT:")
-            title_part = parts[0].replace("TITLE:", "").strip()
-            content_part = parts[1].strip()
+    prompt = build_prompt(topic, research_context, style)
 
-            title = title_part
-            content = content_part
+    try:
+        post = parse_response(get_client(model_name).generate(prompt), topic)
 
-        # Clean up markdown code blocks if Gemini added them
-        content = content.replace("```html", "").replace("```", "")
+        if store:
+            store.set(key, post)
 
-        return title, content
+        return post
 
     except Exception as e:
         print(f"Error generating content: {e}")
+        return None
+
+def write_blog_post(topic, research_context, model_name=MODEL_NAME, use_cache=True, style=None):
+    """
+    Generates a blog post title and content using Gemini (see generate_post).
+
+    Returns:
+        tuple: (title, html_content), or (None, None) on failure.
+    """
+    post = generate_post(topic, research_context, model_name, use_cache, style)
+    if not post:
         return None, None
+    return post['title'], post['content']
+
+def write_many(jobs, max_workers=MAX_WORKERS):
+    """
+    Generates several posts concurrently.
+
+    All threads share the model's GeminiClient, so the requests- and
+    tokens-per-minute limits and quota backoff hold for the whole batch.
+
+    Args:
+        jobs (list): (topic, research_context) pairs.
+
+    Returns:
+        list: (title, html_content) per job, in the same order.
+    """
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        return list(pool.map(lambda job: write_blog_post(*job), jobs))
 
 if __name__ == "__main__":
     # Test (will fail without key)